@@ -0,0 +1,266 @@
+"""
+Tracks the performance of the compiler on the Jack programs of the repository, across commits.
+
+Compiles every program in memory (no files are written next to the sources) and measures:
+    - The wall time of every phase of the compiler: lexing, parsing and code generation, the best of a few runs
+    - The peak memory of compiling the program, as traced by tracemalloc
+    - The amount of VM instructions the program compiled to
+    - The instructions and the estimated cycles the compiled program runs, if it halts in the emulator
+
+The results are appended to a JSON history file, together with the commit they were measured at, and compared
+with the last results in the history that were measured with the same options. A phase that got slower, or a
+program that got bigger, by more than the thresholds is reported as a regression, and the exit code is 1.
+
+Usage:
+    python3 benchmarks/compile_suite.py [--history FILE] [--repeat TIMES] [--no-record] [--optimize]
+                                        [--reduce-strength] [--peephole] [--pool-strings] [path ...]
+"""
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jack_elements import JackClass, JackProgram, VmWriter, format_instruction, \
+    parse_instruction                                                   # noqa: E402
+from jack_parser import JackParser                                      # noqa: E402
+from jack_sources import jack_sources                                   # noqa: E402
+from lexer import Lexer, TokenParseError                                # noqa: E402
+from peephole import PeepholeOptimizer, PeepholeWriter                  # noqa: E402
+from vm_emulator import VmEmulator, VmError                             # noqa: E402
+
+PROGRAMS = ('SpaceInvaders', 'huji_tests/Pong', 'huji_tests/Square', 'huji_tests/ComplexArrays',
+            'tests/Game1', 'tests/Game2', 'tests/Game3')
+DEFAULT_HISTORY = os.path.join(ROOT, 'benchmarks', 'compile_history.json')
+
+PHASES = ('lex', 'parse', 'codegen')
+# The metrics that are compared with the previous results, and the threshold each one of them is checked with
+TIME_METRICS = tuple(f'{phase}_seconds' for phase in PHASES)
+MEMORY_METRICS = ('peak_memory_bytes',)
+SIZE_METRICS = ('vm_instructions', 'cycles')
+# Phases of small programs take about a millisecond, so smaller changes than that are noise and not regressions
+TIME_RESOLUTION = 0.001
+
+
+def program_sources(path: str):
+    """Read the Jack files of a program, by the name of their class"""
+    for file_path, content in jack_sources([path], recursive=False):
+        yield os.path.splitext(os.path.basename(file_path))[0], content
+
+
+def parse_class(content: str, args: argparse.Namespace, timings: dict) -> JackClass:
+    """Parses the code of a class, and adds the time every phase took to the given timings"""
+    start = time.perf_counter()
+    tokens = Lexer(content).tokenize()
+    lexed = time.perf_counter()
+    parsed_class = JackParser(tokens).parse()
+    parsed = time.perf_counter()
+
+    if args.optimize:
+        parsed_class.optimize(args.reduce_strength)
+    optimized = time.perf_counter()
+
+    timings['lex'] += lexed - start
+    timings['parse'] += parsed - lexed
+    timings['codegen'] += optimized - parsed
+    return parsed_class
+
+
+def generate_class(parsed_class: JackClass, args: argparse.Namespace, timings: dict) -> str:
+    """Generates the VM code of a parsed class, and adds the time it took to the given timings"""
+    start = time.perf_counter()
+    output_obj = io.StringIO()
+    writer = VmWriter(output_obj)
+    if args.peephole:
+        writer = PeepholeWriter(writer, PeepholeOptimizer())
+
+    parsed_class.write_vm_code(writer)
+    writer.flush()
+
+    timings['codegen'] += time.perf_counter() - start
+    return output_obj.getvalue()
+
+
+def compile_program(sources, args: argparse.Namespace):
+    """Compiles all the classes of a program, and returns their VM code and the time every phase took"""
+    timings = dict.fromkeys(PHASES, 0.0)
+    if not args.pool_strings:
+        # Every class is dropped once its code was generated, like when the compiler compiles files on their own
+        code = {class_name: generate_class(parse_class(content, args, timings), args, timings)
+                for class_name, content in sources}
+        return code, timings
+
+    # Pooled literals take statics, which are budgeted for the whole program like --whole-program does
+    parsed_classes = {class_name: parse_class(content, args, timings) for class_name, content in sources}
+    start = time.perf_counter()
+    JackProgram(parsed_classes.values()).pool_strings()
+    timings['codegen'] += time.perf_counter() - start
+
+    code = {class_name: generate_class(parsed_class, args, timings)
+            for class_name, parsed_class in parsed_classes.items()}
+    return code, timings
+
+
+def measure(path: str, args: argparse.Namespace) -> dict:
+    """Measures a single program"""
+    sources = list(program_sources(path))
+    best = dict.fromkeys(PHASES, float('inf'))
+    for _ in range(args.repeat):
+        code, timings = compile_program(sources, args)
+        best = {phase: min(best[phase], timings[phase]) for phase in PHASES}
+
+    # Tracing allocations slows everything down, so the memory is measured in a run of its own. It starts from a
+    # clean state, so it doesn't depend on the garbage and the formatted instructions that previous runs left
+    format_instruction.cache_clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        compile_program(sources, args)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    program = [(class_name, parse_instruction(line)) for class_name, vm_code in code.items()
+               for line in vm_code.splitlines()]
+    result = {
+        'files': len(sources),
+        'lines': sum(content.count('\n') for _, content in sources),
+        **{f'{phase}_seconds': best[phase] for phase in PHASES},
+        'total_seconds': sum(best.values()),
+        'peak_memory_bytes': peak_memory,
+        'vm_instructions': len(program),
+        'executed_instructions': None,
+        'cycles': None,
+    }
+
+    # Only programs that halt have a meaningful count of cycles, interactive ones run until they're stopped
+    try:
+        emulator = VmEmulator(program)
+        if emulator.run(args.max_instructions):
+            result['executed_instructions'] = emulator.instruction_count
+            result['cycles'] = emulator.cycle_count
+    except VmError:
+        pass
+
+    return result
+
+
+def current_commit():
+    """Returns the commit the repository is at, and whether it has uncommitted changes"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+    return commit, bool(status.strip())
+
+
+def output_options(args: argparse.Namespace):
+    """The options the programs were compiled with, results are only compared with results of the same options"""
+    return [f'--{name.replace("_", "-")}' for name in ('optimize', 'reduce_strength', 'peephole', 'pool_strings')
+            if getattr(args, name)]
+
+
+def regressions(previous: dict, current: dict, args: argparse.Namespace):
+    """Yields a description of every metric of every program that got worse by more than its threshold"""
+    thresholds = [(TIME_METRICS, args.time_threshold), (MEMORY_METRICS, args.memory_threshold),
+                  (SIZE_METRICS, args.size_threshold)]
+    for program, result in current['programs'].items():
+        previous_result = previous['programs'].get(program)
+        if previous_result is None:
+            continue
+
+        for metrics, threshold in thresholds:
+            for metric in metrics:
+                old, new = previous_result.get(metric), result.get(metric)
+                if old is None or new is None:
+                    continue
+
+                if new > old * (1 + threshold) and (metric not in TIME_METRICS or new - old > TIME_RESOLUTION):
+                    change = f'{(new - old) / old:+.1%}' if old else 'new'
+                    yield f'{program}: {metric} {old:g} -> {new:g} ({change})'
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the compiler on the Jack programs of the repository.")
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help="The JSON file the results are appended to.")
+    parser.add_argument('--repeat', type=int, default=5, help="How many times to compile every program.")
+    parser.add_argument('--no-record', action='store_true', help="Compare the results without recording them.")
+    parser.add_argument('--time-threshold', type=float, default=0.2,
+                        help="The fraction a phase may get slower by before it's a regression.")
+    parser.add_argument('--memory-threshold', type=float, default=0.1,
+                        help="The fraction the peak memory may grow by before it's a regression.")
+    parser.add_argument('--size-threshold', type=float, default=0.0,
+                        help="The fraction the instructions and cycles may grow by before it's a regression.")
+    parser.add_argument('--max-instructions', type=int, default=2_000_000,
+                        help="How many instructions to run a program for, before deciding it doesn't halt.")
+    parser.add_argument('--optimize', '-O', action='store_true', help="Compile with --optimize.")
+    parser.add_argument('--reduce-strength', action='store_true', help="Compile with --reduce-strength.")
+    parser.add_argument('--peephole', action='store_true', help="Compile with --peephole.")
+    parser.add_argument('--pool-strings', action='store_true', help="Compile with --pool-strings.")
+    parser.add_argument('paths', nargs='*', default=[os.path.join(ROOT, program) for program in PROGRAMS],
+                        help="Directories of the programs to benchmark.")
+    args = parser.parse_args()
+    args.optimize = args.optimize or args.reduce_strength
+
+    commit, dirty = current_commit()
+    current = {
+        'commit': commit,
+        'dirty': dirty,
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'options': output_options(args),
+        'programs': {},
+    }
+
+    print(f'{"program":<26} {"lex ms":>8} {"parse ms":>9} {"codegen ms":>11} {"peak KB":>9} '
+          f'{"instructions":>13} {"cycles":>10}')
+    for path in args.paths:
+        program = os.path.relpath(os.path.abspath(path), ROOT)
+        try:
+            result = measure(path, args)
+        except (TokenParseError, OSError) as err:
+            print(f'{program}: {err}', file=sys.stderr)
+            return 1
+
+        current['programs'][program] = result
+        cycles = '-' if result['cycles'] is None else result['cycles']
+        print(f'{program:<26} {result["lex_seconds"] * 1000:>8.2f} {result["parse_seconds"] * 1000:>9.2f} '
+              f'{result["codegen_seconds"] * 1000:>11.2f} {result["peak_memory_bytes"] / 1024:>9.0f} '
+              f'{result["vm_instructions"]:>13} {cycles:>10}')
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, 'r') as history_obj:
+            history = json.load(history_obj)
+
+    previous = next((entry for entry in reversed(history) if entry['options'] == current['options']), None)
+    found = [] if previous is None else list(regressions(previous, current, args))
+    if previous is not None:
+        print(f'\nCompared with {previous["commit"] or "an unknown commit"} ({previous["date"]}): '
+              f'{len(found) or "no"} regressions')
+        for regression in found:
+            print(f'    {regression}')
+
+    if not args.no_record:
+        history.append(current)
+        with open(args.history, 'w') as history_obj:
+            json.dump(history, history_obj, indent=2)
+
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+"""
+Finds the Jack files the benchmarks run on.
+"""
+import os
+from typing import Iterable, Iterator, Tuple
+
+
+def jack_sources(paths: Iterable[str], recursive: bool = True) -> Iterator[Tuple[str, str]]:
+    """
+    Read the Jack files in the given directories, and their subdirectories unless recursive is unset.
+    Yields the path of every file together with its code, in the order of their names.
+    """
+    for path in paths:
+        for dir_path, dir_names, filenames in os.walk(path):
+            dir_names.sort()
+            if not recursive:
+                dir_names.clear()
+
+            for filename in sorted(filenames):
+                if filename.endswith('.jack'):
+                    file_path = os.path.join(dir_path, filename)
+                    with open(file_path, 'r') as file_obj:
+                        yield file_path, file_obj.read()
@@ -0,0 +1,74 @@
+"""
+Measures how the lexer scales with the size of its input.
+
+Generates Jack classes of growing sizes (from 1K lines up to 1M lines by default), lexes each one of them and
+prints the time it took, together with the time it took per line. A linear lexer keeps the time per line
+roughly constant across all sizes.
+
+Usage:
+    python3 benchmarks/lexer_scaling.py [--max-lines LINES]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexer import Lexer                                         # noqa: E402
+
+
+SUBROUTINE_TEMPLATE = '''\
+    /** Subroutine number {index} */
+    method int compute{index}(int x, int y) {{
+        var int result;
+        let result = x + (y * {index}); // Some arithmetic
+        if (result > 100) {{
+            do Output.printString("Result is too big");
+        }}
+        return result;
+    }}
+'''
+SUBROUTINE_LINES = SUBROUTINE_TEMPLATE.count('\n')
+
+
+def generate_class(lines: int) -> str:
+    """Generate a Jack class with (about) the given amount of lines"""
+    subroutines = (SUBROUTINE_TEMPLATE.format(index=i) for i in range(max(lines // SUBROUTINE_LINES, 1)))
+    return f'class Main {{\n{"".join(subroutines)}}}\n'
+
+
+def lex(content: str) -> int:
+    """Lex the given content to the end, and return the amount of tokens found"""
+    lexer = Lexer(content)
+    count = 0
+    while not lexer.finished:
+        lexer.next()
+        count += 1
+
+    return count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the lexer's scaling with the input size.")
+    parser.add_argument('--max-lines', type=int, default=1000000, help="Size of the biggest generated class.")
+    args = parser.parse_args()
+
+    print(f'{"lines":>10} {"tokens":>10} {"seconds":>10} {"us/line":>10}')
+    lines = 1000
+    while lines <= args.max_lines:
+        content = generate_class(lines)
+        actual_lines = content.count('\n')
+
+        start = time.perf_counter()
+        tokens = lex(content)
+        elapsed = time.perf_counter() - start
+
+        print(f'{actual_lines:>10} {tokens:>10} {elapsed:>10.3f} {elapsed * 1e6 / actual_lines:>10.2f}')
+        lines *= 10
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Measures the throughput of every lexer backend, in tokens per second.
+
+Lexes all the Jack files under the given paths (the whole repository by default) with each one of the backends
+in lexer.LEXERS, and prints how many tokens per second each backend produced.
+
+Usage:
+    python3 benchmarks/lexer_throughput.py [--repeat TIMES] [path ...]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lexer import LEXERS                                        # noqa: E402
+from jack_sources import jack_sources                           # noqa: E402
+
+
+def lex(lexer_type, content: str) -> int:
+    """Lex the given content to the end, and return the amount of tokens found"""
+    lexer = lexer_type(content)
+    count = 0
+    while not lexer.finished:
+        lexer.next()
+        count += 1
+
+    return count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the throughput of the lexer backends.")
+    parser.add_argument('--repeat', type=int, default=20, help="How many times to lex every file.")
+    parser.add_argument('paths', nargs='*', default=[ROOT], help="Directories to collect Jack files from.")
+    args = parser.parse_args()
+
+    sources = [content for _, content in jack_sources(args.paths)]
+    print(f'{len(sources)} files, {sum(len(source) for source in sources)} characters')
+    print(f'{"lexer":>10} {"tokens":>10} {"seconds":>10} {"tokens/s":>12}')
+    for name, lexer_type in LEXERS.items():
+        start = time.perf_counter()
+        tokens = sum(lex(lexer_type, source) for _ in range(args.repeat) for source in sources)
+        elapsed = time.perf_counter() - start
+
+        print(f'{name:>10} {tokens:>10} {elapsed:>10.3f} {tokens / elapsed:>12.0f}')
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
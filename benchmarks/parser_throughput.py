@@ -0,0 +1,74 @@
+"""
+Measures the throughput of the parser, in tokens per second.
+
+Lexes all the Jack files under the given paths (the whole repository by default) up front, and then parses
+their tokens again and again, so only the parser is measured and not the lexer. The Jack files of the repository
+are small, so an identifier heavy class is also generated, to measure resolving symbols at scale: every one of its
+statements reads fields, statics, arguments and locals, and calls functions of other classes.
+
+Usage:
+    python3 benchmarks/parser_throughput.py [--repeat TIMES] [--variables COUNT] [path ...]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jack_parser import JackParser                              # noqa: E402
+from lexer import Lexer                                         # noqa: E402
+from jack_sources import jack_sources                           # noqa: E402
+
+
+def identifier_heavy_class(variables: int) -> str:
+    """Generates a class with the given amount of variables of every kind, and subroutines that use all of them"""
+    names = [f'v{index}' for index in range(variables)]
+    lines = ['class Heavy {']
+    lines += [f'    field int field_{name};' for name in names]
+    lines += [f'    static int static_{name};' for name in names]
+    for subroutine in range(variables):
+        arguments = ', '.join(f'int argument_{name}' for name in names)
+        lines.append(f'    method int run{subroutine}({arguments}) {{')
+        lines += [f'        var int local_{name};' for name in names]
+        for name in names:
+            lines.append(f'        let local_{name} = field_{name} + static_{name} - argument_{name};')
+            lines.append(f'        do Output.printInt(Math.max(local_{name}, field_{name}));')
+            lines.append(f'        let static_{name} = run{subroutine}(local_{name});')
+
+        lines += ['        return 0;', '    }']
+
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the throughput of the parser.")
+    parser.add_argument('--repeat', type=int, default=20, help="How many times to parse every file.")
+    parser.add_argument('--variables', type=int, default=60,
+                        help="How many variables of every kind the generated class has.")
+    parser.add_argument('paths', nargs='*', default=[ROOT], help="Directories to collect Jack files from.")
+    args = parser.parse_args()
+
+    sources = {
+        'repository': [Lexer(content).tokenize() for _, content in jack_sources(args.paths)],
+        'generated': [Lexer(identifier_heavy_class(args.variables)).tokenize()],
+    }
+
+    print(f'{"sources":>10} {"files":>6} {"tokens":>10} {"seconds":>10} {"tokens/s":>12}')
+    for name, token_arrays in sources.items():
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for tokens in token_arrays:
+                JackParser(tokens).parse()
+        elapsed = time.perf_counter() - start
+
+        tokens = args.repeat * sum(len(token_array) for token_array in token_arrays)
+        print(f'{name:>10} {len(token_arrays):>6} {tokens:>10} {elapsed:>10.3f} {tokens / elapsed:>12.0f}')
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import mmap
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Optional, Sequence, Union
+
+# The directory of the cache in the user's cache directory, which all the compiled sources share
+CACHE_DIRECTORY = 'jack_compiler'
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# The compiler's own code is a part of the key, so changing the compiler invalidates everything it built
+_COMPILER_ROOT = os.path.dirname(os.path.abspath(__file__))
+_COMPILER_PACKAGES = ('', 'lexer', 'jack_elements')
+
+
+@lru_cache(maxsize=None)
+def compiler_version() -> str:
+    """Returns a digest of the source code of the compiler"""
+    digest = hashlib.sha256()
+    for package in _COMPILER_PACKAGES:
+        directory = os.path.join(_COMPILER_ROOT, package)
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.py'):
+                digest.update(os.path.join(package, filename).encode())
+                with open(os.path.join(directory, filename), 'rb') as module_obj:
+                    digest.update(module_obj.read())
+
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """
+    An on-disk cache of compiled files, keyed by the hash of the source code and the compiler version.
+
+    Every output of a source is an entry file named after the key and the output's extension. Entries are
+    touched whenever they are used. Once a build is done, evict removes the least recently used entries until
+    the cache fits in its maximal size, so the cache is only scanned once per build.
+    """
+    _directory: str
+    _max_size: int
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self._directory = directory
+        self._max_size = max_size
+
+    @staticmethod
+    def key(content: Union[str, bytes, mmap.mmap], options: Sequence[str] = (), name: str = '') -> str:
+        """
+        Returns the key of the given source code, compiled with the given command line options.
+        The code is either text, or the encoded code as it's stored in the file, which is hashed without a copy.
+        name is the base name of the source file. It's a part of the key, since a class only compiles in a file
+        that is named after it.
+        """
+        digest = hashlib.sha256(compiler_version().encode())
+        digest.update('\0'.join(options).encode() + b'\0')
+        digest.update(name.encode() + b'\0')
+        digest.update(content.encode() if isinstance(content, str) else content)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str, extension: str) -> str:
+        return os.path.join(self._directory, key + extension)
+
+    def fetch(self, key: str, extension: str, output_path: str) -> bool:
+        """Copies a cached output to output_path, returns whether the output was in the cache"""
+        entry_path = self._entry_path(key, extension)
+        try:
+            shutil.copyfile(entry_path, output_path)
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # Not cached, or evicted meanwhile by another build
+            return False
+
+        return True
+
+    def fetch_text(self, key: str, extension: str) -> Optional[str]:
+        """Returns a cached text entry, or None if it isn't in the cache"""
+        entry_path = self._entry_path(key, extension)
+        try:
+            with open(entry_path, 'r') as entry_obj:
+                text = entry_obj.read()
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return None
+
+        return text
+
+    @contextmanager
+    def _new_entry(self, key: str, extension: str) -> Iterator[str]:
+        """Yields a temporary path to write an entry to, which is added to the cache once it was written"""
+        os.makedirs(self._directory, exist_ok=True)
+
+        # Other builds may read the cache at the same time, so the entry only appears once it's complete
+        temp_fd, temp_path = tempfile.mkstemp(dir=self._directory)
+        os.close(temp_fd)
+        yield temp_path
+        os.replace(temp_path, self._entry_path(key, extension))
+
+    def store(self, key: str, extension: str, output_path: str) -> None:
+        """Adds a compiled output to the cache"""
+        with self._new_entry(key, extension) as temp_path:
+            shutil.copyfile(output_path, temp_path)
+
+    def store_text(self, key: str, extension: str, text: str) -> None:
+        """Adds a text entry to the cache"""
+        with self._new_entry(key, extension) as temp_path, open(temp_path, 'w') as entry_obj:
+            entry_obj.write(text)
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in its maximal size"""
+        entries = []
+        size = 0
+        try:
+            with os.scandir(self._directory) as directory:
+                for entry in directory:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    size += stat.st_size
+        except FileNotFoundError:
+            # Nothing was cached yet
+            return
+
+        entries.sort()
+        for _, entry_size, entry_path in entries:
+            if size <= self._max_size:
+                break
+
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+
+            size -= entry_size
+
+
+def user_cache(max_size: int = DEFAULT_MAX_SIZE) -> BuildCache:
+    """
+    Returns the build cache of the user, in $XDG_CACHE_HOME (~/.cache by default), so the compiler never writes
+    anything next to the sources besides their outputs. Entries don't depend on the directory of their source,
+    so the outputs of all the sources share it.
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return BuildCache(os.path.join(cache_home, CACHE_DIRECTORY), max_size)
@@ -0,0 +1,101 @@
+import os
+import sys
+import _socket
+from typing import Optional, Sequence, Tuple
+
+# The client is started for every compilation, so it avoids importing anything beyond the builtin modules:
+# it talks to the server with the builtin _socket module, and the compiler itself is only imported if there's
+# no server to talk to.
+SOCKET_ENVIRONMENT_VARIABLE = 'JACK_COMPILER_SOCKET'
+
+
+def socket_path() -> str:
+    """Returns the path of the Unix socket the compile server listens on"""
+    default_path = os.path.join(os.environ.get('TMPDIR', '/tmp'), f'jack_compiler-{os.getuid()}.sock')
+    return os.environ.get(SOCKET_ENVIRONMENT_VARIABLE, default_path)
+
+
+def encode_request(cwd: str, argv: Sequence[str]) -> bytes:
+    """A request is the working directory and the command line arguments of the client, separated by nulls"""
+    return '\0'.join([cwd, *argv]).encode()
+
+
+def decode_request(request: bytes) -> Sequence[str]:
+    return request.decode().split('\0')
+
+
+def encode_response(status: int, stdout: str, stderr: str) -> bytes:
+    """A response is a header line with the exit status and the length of stdout, followed by stdout and stderr"""
+    stdout_data = stdout.encode()
+    return f'{status} {len(stdout_data)}\n'.encode() + stdout_data + stderr.encode()
+
+
+def decode_response(response: bytes) -> Tuple[int, str, str]:
+    """
+    Splits a response to the exit status, stdout and stderr. A response that was cut short, because the server
+    died before it was done responding, is an error of the server.
+    """
+    header, _, body = response.partition(b'\n')
+    try:
+        status, stdout_length = map(int, header.split())
+    except ValueError:
+        return 1, '', 'Error: The compile server closed the connection without a response\n'
+
+    if len(body) < stdout_length:
+        return 1, '', 'Error: The compile server closed the connection in the middle of its response\n'
+
+    return status, body[:stdout_length].decode(), body[stdout_length:].decode()
+
+
+def _receive_all(connection: _socket.socket) -> bytes:
+    chunks = []
+    chunk = connection.recv(65536)
+    while chunk:
+        chunks.append(chunk)
+        chunk = connection.recv(65536)
+
+    return b''.join(chunks)
+
+
+def request_compile(argv: Sequence[str], path: str) -> Optional[int]:
+    """
+    Sends the command line arguments to the compile server, writes its output and returns its exit status.
+    Returns None if there's no server listening on the given socket path.
+    """
+    try:
+        connection = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    except (AttributeError, OSError):
+        # Unix sockets aren't supported on this platform
+        return None
+
+    try:
+        try:
+            connection.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+
+        connection.sendall(encode_request(os.getcwd(), argv))
+        connection.shutdown(_socket.SHUT_WR)
+        status, stdout, stderr = decode_response(_receive_all(connection))
+
+    finally:
+        connection.close()
+
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return status
+
+
+def main() -> int:
+    """Main entrypoint of the module, compiles through the server or in this process if it isn't running"""
+    argv = sys.argv[1:]
+    status = request_compile(argv, socket_path())
+    if status is None:
+        from compiler import main as compile_main
+        status = compile_main(argv)
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
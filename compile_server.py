@@ -0,0 +1,82 @@
+import io
+import os
+import sys
+import signal
+import argparse
+import traceback
+import socketserver
+from contextlib import redirect_stderr, redirect_stdout
+from compiler import main as compile_main
+from compile_client import socket_path, decode_request, encode_response
+
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a single compile request: the working directory and the command line arguments of the client.
+    Responds with the output of the compiler and its exit status.
+    """
+
+    def handle(self) -> None:
+        cwd, *argv = decode_request(self.rfile.read())
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                os.chdir(cwd)
+                status = compile_main(argv)
+            except SystemExit as err:
+                # Invalid arguments, or --help
+                status = err.code if isinstance(err.code, int) else 1
+            except OSError as err:
+                print(f'Error: {str(err)}', file=sys.stderr)
+                status = 1
+            except Exception:
+                # A bug of the compiler, or an input it can't handle, the client still gets a response
+                traceback.print_exc()
+                status = 1
+
+        self.wfile.write(encode_response(status, stdout.getvalue(), stderr.getvalue()))
+
+
+class CompileServer(socketserver.UnixStreamServer):
+    """
+    A long lived compiler, that keeps the compiler's modules loaded between compilations.
+    Requests are handled one at a time, since each of them changes the working directory of the server.
+    """
+
+    def server_bind(self) -> None:
+        # A socket file that was left by a server that didn't exit cleanly
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+        super().server_bind()
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def main() -> int:
+    """Main entrypoint of the module"""
+    parser = argparse.ArgumentParser(description="Jack language compile server.")
+    parser.add_argument('--socket', default=socket_path(),
+                        help="The path of the Unix socket to listen on (the clients' default path by default).")
+    args = parser.parse_args()
+
+    # Stopping the server with kill removes its socket, just like Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with CompileServer(args.socket, CompileRequestHandler) as server:
+        print(f'Listening on {args.socket}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
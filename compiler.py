@@ -1,79 +1,491 @@
 import argparse
 import sys
 import os
-from typing import Sequence
-from xml_compiler import JackXmlCompiler
-from vm_compiler import JackVmCompiler
-from lexer import TokenParseError
+import io
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from contextlib import ExitStack, contextmanager
+from fnmatch import fnmatch
+from pathlib import PurePath
+from typing import IO, Iterable, Iterator, List, Optional, Sequence, Tuple, Type, Union
+from jack_parser import JackParser
+from xml_compiler import write_syntax
+from vm_compiler import write_vm_code, VM_WRITERS
+from jack_elements import JackClass, JackProgram, VmWriter
+from lexer import Lexer, StreamLexer, TokenArray, TokenParseError, LEXERS
+from build_cache import user_cache
+from peephole import PeepholeOptimizer
+from profiler import FileProfile, PROFILE_WRITERS, phase, run_profiled
 
 
-def files_from_path(path: str) -> Sequence[str]:
-    """Translate supplied assembly path to a list of objects to assemble"""
+def _matches(name: str, relative_path: str, patterns: Sequence[str]) -> bool:
+    """
+    Whether a file or a directory matches one of the given globs. A glob of a name matches the name, and a glob of
+    a path matches the relative path one directory at a time, so its wildcards never match across directories.
+    """
+    parts = PurePath(relative_path).parts
+    for pattern in patterns:
+        pattern_parts = PurePath(pattern).parts
+        if len(pattern_parts) == 1:
+            if fnmatch(name, pattern):
+                return True
+
+        elif len(pattern_parts) == len(parts) and all(map(fnmatch, parts, pattern_parts)):
+            return True
+
+    return False
+
+
+def _walk(path: str, relative_path: str, recursive: bool, include: Sequence[str],
+          exclude: Sequence[str]) -> Iterator[str]:
+    """Yields the files to compile in a directory, while it's being scanned"""
+    with os.scandir(path) as directory:
+        entries = sorted(directory, key=lambda entry: entry.name)
+
+    for entry in entries:
+        entry_relative_path = os.path.join(relative_path, entry.name)
+        if _matches(entry.name, entry_relative_path, exclude):
+            continue
+
+        if entry.is_dir(follow_symlinks=False):
+            if recursive:
+                yield from _walk(entry.path, entry_relative_path, recursive, include, exclude)
+
+        elif entry.is_file() and _matches(entry.name, entry_relative_path, include):
+            yield entry.path
+
+
+def files_from_path(path: str, recursive: bool = False, include: Sequence[str] = ('*.jack',),
+                    exclude: Sequence[str] = ()) -> Iterator[str]:
+    """
+    Translate supplied path to the files to compile. Directories are scanned lazily, so the files can be
+    compiled while the rest of the tree is still being scanned.
+    """
     if os.path.isdir(path):
         # Handle case path is a directory
-        full_paths = (os.path.abspath(os.path.join(path, filename)) for filename in os.listdir(path))
-        output = [path for path in full_paths if os.path.isfile(path) and path.endswith('.jack')]
-
-        return output
+        return _walk(os.path.abspath(path), '', recursive, include, exclude)
 
     elif os.path.isfile(path):
         # Handle case path is a file
-        return [os.path.abspath(path)]
+        return iter([os.path.abspath(path)])
 
     else:
         raise ValueError(f'Path "{str(path)}" is not a file or a directory')
 
 
-def analyze_file(input_path: str, output_path: str) -> None:
-    """Analyzes a given file using JackXmlCompiler"""
-    try:
-        with open(input_path, 'r') as input_obj:
-            with open(output_path, 'w') as output_obj:
-                compiler = JackXmlCompiler(input_obj.read())
-                compiler.analyze(output_obj)
+# The cache entry with the commands count of a file before and after the peephole optimizer
+PEEPHOLE_COUNTS_EXTENSION = '.peephole'
+
+# VM code is written through a large buffer, so most files are written with a single system call
+OUTPUT_BUFFER_SIZE = 256 * 1024
+
+
+@contextmanager
+def map_source(input_path: str) -> Iterator[Union[mmap.mmap, bytes]]:
+    """
+    Maps a source file to memory, so its code is decoded right from the pages of the file instead of being
+    read into a buffer first. Empty files can't be mapped, their code is empty bytes.
+    """
+    with open(input_path, 'rb') as input_obj:
+        if os.fstat(input_obj.fileno()).st_size == 0:
+            yield b''
+        else:
+            with mmap.mmap(input_obj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+
+def decode_source(data: Union[mmap.mmap, bytes]) -> str:
+    """Decodes the code of a source file, with its new lines translated to '\\n' like in text files"""
+    content = str(data, 'utf-8')
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+
+    return content
+
+
+def prepare_source(content: Union[str, IO], lexer_type: Type[Lexer] = Lexer,
+                   pretokenize: bool = False) -> Union[str, TokenArray, IO]:
+    """
+    Prepares the content of a file for parsing, and splits it to tokens up front if asked to.
+    content is either the code of the file, or the file itself, which is read in chunks by a StreamLexer.
+    """
+    if pretokenize:
+        lexer = lexer_type(content) if isinstance(content, str) else StreamLexer(content)
+        return lexer.tokenize()
 
-    except TokenParseError as err:
-        print(f'{input_path}:')
-        print(err)
+    return content
 
 
-def compile_file(input_path: str, output_path: str) -> None:
-    """Compiles a given file using JackVmCompiler"""
+def parse_file(source: Union[str, TokenArray, IO], lexer_type: Type[Lexer] = Lexer,
+               xml_output_path: Optional[str] = None, profile: Optional[FileProfile] = None) -> JackClass:
+    """
+    Parses a given file's source. If xml_output_path is given, the parsed code is also written to it as an XML
+    hierarchy, even if the code has errors. If a profile is given, the parsing and the writing are timed.
+    A file that is read in chunks has its XML written while it's parsed, instead of keeping its whole syntax
+    first, so the XML is timed as a part of parsing.
+    """
+    if xml_output_path is not None and not isinstance(source, (str, TokenArray)):
+        with open(xml_output_path, 'w') as xml_obj, phase(profile, 'parse'):
+            parsed_class = JackParser(source, lexer_type, syntax_output=xml_obj).parse()
+
+    else:
+        parser = JackParser(source, lexer_type, retain_syntax=xml_output_path is not None)
+        try:
+            with phase(profile, 'parse'):
+                parsed_class = parser.parse()
+        finally:
+            if xml_output_path is not None:
+                with phase(profile, 'write'), open(xml_output_path, 'w') as xml_obj:
+                    write_syntax(parser.syntax, xml_obj)
+
+    if profile is not None:
+        profile.count_nodes(parsed_class)
+
+    return parsed_class
+
+
+def compile_file(input_path: str, output_path: str, source: Union[str, TokenArray, IO],
+                 lexer_type: Type[Lexer] = Lexer, xml_output_path: Optional[str] = None,
+                 optimize: bool = False, reduce_strength: bool = False,
+                 peephole: Optional[PeepholeOptimizer] = None, label_map_path: Optional[str] = None,
+                 writer_type: Type[VmWriter] = VmWriter, profile: Optional[FileProfile] = None) -> str:
+    """
+    Compiles a given file's source to VM code, and returns the errors report of the file.
+    If xml_output_path is given, the parsed code is also written to it as an XML hierarchy, from the same
+    single parse. If label_map_path is given, the source positions of the labels are written to it.
+    optimize, reduce_strength, peephole and writer_type are passed to write_vm_code.
+    If a profile is given, the phases of the compilation are timed, and what they produced is counted.
+    """
     try:
-        with open(input_path, 'r') as input_obj:
-            with open(output_path, 'w') as output_obj:
-                compiler = JackVmCompiler(input_obj.read(), output_obj)
-                compiler.compile()
+        with ExitStack() as stack:
+            with phase(profile, 'write'):
+                output_obj = stack.enter_context(open(output_path, writer_type.FILE_MODE,
+                                                      buffering=OUTPUT_BUFFER_SIZE))
+                label_map = None if label_map_path is None else stack.enter_context(open(label_map_path, 'w'))
+
+            parsed_class = parse_file(source, lexer_type, xml_output_path, profile)
+            with phase(profile, 'codegen'):
+                instructions = write_vm_code(parsed_class, output_obj, optimize, reduce_strength, peephole,
+                                             label_map, writer_type)
+
+            # Most of the code is only written to the file when it's closed
+            with phase(profile, 'write'):
+                stack.close()
+
+        if profile is not None:
+            profile.instructions = instructions
+
+    except (TokenParseError, ValueError) as err:
+        # ValueError is raised for symbols that were defined twice, and for code the VM writer can't store
+        return f'{input_path}:\n{err}\n'
+
+    return ''
+
+
+def output_options(args: argparse.Namespace) -> Sequence[str]:
+    """Returns the command line options that change the outputs of the compiler"""
+    options = []
+    if args.optimize:
+        options.append('--optimize')
+    if args.reduce_strength:
+        options.append('--reduce-strength')
+    if args.peephole:
+        options.append('--peephole')
+
+    return options
+
+
+def build_file(input_path: str, args: argparse.Namespace, profile: Optional[FileProfile] = None) -> str:
+    """
+    Reads and compiles a given file as asked by the command line arguments, and returns the errors report
+    of the file. Doesn't print anything, so files can be built in parallel.
+    Files that were already compiled are copied from the build cache, unless --no-cache is given.
+    If a profile is given, the phases of building the file are timed.
+    """
+    # When analyzing, both the XML and the VM code are generated from a single parse
+    base_path = os.path.splitext(input_path)[0]
+    writer_type = VM_WRITERS[args.format]
+    outputs = {writer_type.EXTENSION: f'{base_path}{writer_type.EXTENSION}'}
+    if args.analyze:
+        outputs['.xml'] = f'{base_path}.xml'
+    if args.label_map:
+        outputs['.labels'] = f'{base_path}.labels'
+
+    with ExitStack() as stack:
+        with phase(profile, 'read'):
+            data = stack.enter_context(map_source(input_path))
+            if args.stream:
+                # The file is decoded in chunks while it's parsed, so it's never held in memory as a whole. Its
+                # content isn't known before it's compiled, so it isn't looked up in the build cache
+                content, cache = io.BytesIO(data) if isinstance(data, bytes) else data, None
+            else:
+                content = decode_source(data)
+                cache = None if args.no_cache else user_cache()
+
+        if cache is not None:
+            key = cache.key(data, output_options(args), os.path.basename(input_path))
+            with phase(profile, 'write'):
+                cached = all(cache.fetch(key, extension, output_path) for extension, output_path in outputs.items())
+                # The commands count of the peephole optimizer is reported even when the file wasn't compiled
+                counts = cache.fetch_text(key, PEEPHOLE_COUNTS_EXTENSION) if cached and args.peephole else None
 
-    except TokenParseError as err:
-        print(f'{input_path}:')
-        print(err)
+            if cached and (counts is not None or not args.peephole):
+                if profile is not None:
+                    profile.cached = True
+                return peephole_report(input_path, None if counts is None else tuple(map(int, counts.split())))
 
+        lexer_type = LEXERS[args.lexer]
+        try:
+            with phase(profile, 'lex'):
+                source = prepare_source(content, lexer_type, pretokenize=args.pretokenize)
+        except TokenParseError as err:
+            return f'{input_path}:\n{err}\n'
 
-def main() -> int:
-    """Main entrypoint of the module"""
+        if profile is not None and isinstance(source, TokenArray):
+            profile.tokens = len(source)
+
+        peephole = PeepholeOptimizer() if args.peephole else None
+        report = compile_file(input_path, outputs[writer_type.EXTENSION], source, lexer_type, outputs.get('.xml'),
+                              args.optimize, args.reduce_strength, peephole, outputs.get('.labels'),
+                              writer_type, profile)
+
+    # Files with errors are compiled again every time, so their errors are always reported
+    if cache is not None and not report:
+        with phase(profile, 'write'):
+            for extension, output_path in outputs.items():
+                cache.store(key, extension, output_path)
+            if peephole is not None:
+                cache.store_text(key, PEEPHOLE_COUNTS_EXTENSION, f'{peephole.input_count} {peephole.output_count}\n')
+
+    return report or peephole_report(input_path, peephole_counts(peephole))
+
+
+def profile_file(input_path: str, args: argparse.Namespace) -> Tuple[str, FileProfile]:
+    """
+    Builds a given file like build_file, and returns its errors report together with its profile.
+    If --profile-dump is given, the file is built under cProfile, and its stats are dumped.
+    """
+    profile = FileProfile(input_path)
+    build = partial(build_file, input_path, args, profile)
+    if args.profile_dump is None:
+        return build(), profile
+
+    return run_profiled(build, args.profile_dump, input_path), profile
+
+
+def peephole_counts(peephole: Optional[PeepholeOptimizer]) -> Optional[Tuple[int, int]]:
+    """Returns the commands count of a file before and after a given peephole optimizer optimized it"""
+    if peephole is None:
+        return None
+
+    return peephole.input_count, peephole.output_count
+
+
+def peephole_report(input_path: str, counts: Optional[Tuple[int, int]]) -> str:
+    """Returns the commands count report of a file that was optimized by the peephole optimizer"""
+    if counts is None:
+        return ''
+
+    input_count, output_count = counts
+    return f'{input_path}: {input_count} -> {output_count} VM commands\n'
+
+
+def build_program(files: Iterable[str], args: argparse.Namespace,
+                  profiles: Optional[List[FileProfile]] = None) -> Iterator[str]:
+    """
+    Compiles the given files as a single program: all the files are parsed first, and the subroutines that
+    can't run when the program starts from Main.main are removed before any VM code is written.
+    Yields the errors reports of the files. If a profiles list is given, the profiles of the files are added
+    to it.
+    """
+    lexer_type = LEXERS[args.lexer]
+    program = JackProgram()
+    parsed_files = []
+    for input_path in files:
+        base_path = os.path.splitext(input_path)[0]
+        profile = None
+        if profiles is not None:
+            profile = FileProfile(input_path)
+            profiles.append(profile)
+
+        try:
+            with ExitStack() as stack:
+                with phase(profile, 'read'):
+                    data = stack.enter_context(map_source(input_path))
+                    if args.stream:
+                        content = io.BytesIO(data) if isinstance(data, bytes) else data
+                    else:
+                        content = decode_source(data)
+
+                with phase(profile, 'lex'):
+                    source = prepare_source(content, lexer_type, pretokenize=args.pretokenize)
+
+                if profile is not None and isinstance(source, TokenArray):
+                    profile.tokens = len(source)
+
+                parsed_class = parse_file(source, lexer_type, f'{base_path}.xml' if args.analyze else None, profile)
+
+            program.add_class(parsed_class)
+        except (TokenParseError, ValueError) as err:
+            # ValueError is raised for classes that were already defined by another file
+            yield f'{input_path}:\n{err}\n'
+            continue
+
+        # Optimizing first removes the calls in code that never runs, so more subroutines can be removed
+        if args.optimize:
+            with phase(profile, 'codegen'):
+                parsed_class.optimize(args.reduce_strength)
+
+        parsed_files.append((input_path, base_path, parsed_class, profile))
+
+    removed = program.prune()
+    yield f'Removed {removed} subroutines that {JackProgram.ENTRY_POINT} never calls\n'
+
+    # The whole program is known, so its literals are pooled within the static segment all the classes share
+    if args.pool_strings:
+        program.pool_strings()
+
+    writer_type = VM_WRITERS[args.format]
+    for input_path, base_path, parsed_class, profile in parsed_files:
+        peephole = PeepholeOptimizer() if args.peephole else None
+        try:
+            with ExitStack() as stack:
+                with phase(profile, 'write'):
+                    output_obj = stack.enter_context(open(f'{base_path}{writer_type.EXTENSION}',
+                                                          writer_type.FILE_MODE, buffering=OUTPUT_BUFFER_SIZE))
+                    label_map = stack.enter_context(open(f'{base_path}.labels', 'w')) if args.label_map else None
+
+                with phase(profile, 'codegen'):
+                    instructions = write_vm_code(parsed_class, output_obj, peephole=peephole, label_map=label_map,
+                                                 writer_type=writer_type)
+
+                with phase(profile, 'write'):
+                    stack.close()
+
+        except (TokenParseError, ValueError) as err:
+            # ValueError is raised for code the VM writer can't store
+            yield f'{input_path}:\n{err}\n'
+        else:
+            if profile is not None:
+                profile.instructions = instructions
+
+            yield peephole_report(input_path, peephole_counts(peephole))
+
+
+def collect_reports(results: Iterable[Union[str, Tuple[str, FileProfile]]],
+                    profiles: Optional[List[FileProfile]] = None) -> Iterator[str]:
+    """
+    Yields the errors reports of built files. Profiled files may be built by other processes, so their results
+    are their reports together with their profiles, and the profiles are added to the given list.
+    """
+    for result in results:
+        if profiles is None:
+            yield result
+        else:
+            report, profile = result
+            profiles.append(profile)
+            yield report
+
+
+def print_reports(reports: Iterable[str]) -> None:
+    """Prints the errors reports of built files"""
+    for report in reports:
+        print(report, end='')
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Main entrypoint of the module, argv are the command line arguments (sys.argv by default)"""
     # Parse args
     parser = argparse.ArgumentParser(description="Jack language compiler.")
     parser.add_argument('--analyze', action="store_true",
                         help="Analyze the give file/files and dump their hierarchy to an XML file.")
+    parser.add_argument('--lexer', choices=LEXERS, default='cursor',
+                        help="The lexer backend that splits the code into tokens.")
+    parser.add_argument('--format', choices=VM_WRITERS, default='text',
+                        help="The format of the VM code: text .vm files, or compact binary .vmb files.")
+    parser.add_argument('--pretokenize', action="store_true",
+                        help="Split every file to tokens up front, before parsing it.")
+    parser.add_argument('--stream', action="store_true",
+                        help="Read every file in chunks while it's parsed, instead of reading it whole first, "
+                             "and write the XML of --analyze while it's parsed too. The VM code still needs the "
+                             "whole parsed class, so its memory still grows with the size of the file (always "
+                             "uses the cursor lexer, and doesn't use the build cache).")
+    parser.add_argument('--optimize', '-O', action="store_true",
+                        help="Simplify the generated VM code, so it runs faster.")
+    parser.add_argument('--reduce-strength', action="store_true",
+                        help="Replace multiplications by constants with additions (implies --optimize).")
+    parser.add_argument('--peephole', action="store_true",
+                        help="Optimize the generated VM code of every function, and report the commands count.")
+    parser.add_argument('--pool-strings', action="store_true",
+                        help="Build the string literals that are printed repeatedly only once, instead of on every "
+                             "print (needs --whole-program, which budgets the statics of all the classes).")
+    parser.add_argument('--label-map', action="store_true",
+                        help="Write the source positions of the labels of every file to a .labels file.")
+    parser.add_argument('--whole-program', action="store_true",
+                        help="Compile all the files as one program, and remove the subroutines Main.main never "
+                             "calls (doesn't use --jobs or the build cache).")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="How many files to compile in parallel (0 for the number of CPUs).")
+    parser.add_argument('--no-cache', action="store_true",
+                        help="Compile every file, even if it didn't change since it was last compiled. The "
+                             "build cache is kept in $XDG_CACHE_HOME/jack_compiler (~/.cache by default).")
+    parser.add_argument('--recursive', '-r', action="store_true",
+                        help="Compile the files in the subdirectories of the given directory as well.")
+    parser.add_argument('--include', action="append",
+                        help="A glob of the names or the relative paths of the files to compile, may be given more "
+                             "than once (*.jack by default). The wildcards of a path never match across directories.")
+    parser.add_argument('--exclude', action="append", default=[],
+                        help="A glob of the names or the relative paths of files or directories to skip, may be given "
+                             "more than once.")
+    parser.add_argument('--profile', choices=PROFILE_WRITERS,
+                        help="Time the phases of compiling every file, and print them as a table or as JSON "
+                             "(lexing is only timed apart from parsing, and tokens are only counted, with "
+                             "--pretokenize).")
+    parser.add_argument('--profile-output',
+                        help="A file to write the profile to, instead of printing it.")
+    parser.add_argument('--profile-dump', metavar='DIRECTORY',
+                        help="Compile every file under cProfile, and dump its stats to a file in the directory "
+                             "(implies --profile table, unless another format is given).")
     parser.add_argument('path', help="A path to a jack file, or a directory with jack files.")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    args.optimize = args.optimize or args.reduce_strength
+    if args.profile_dump is not None and args.profile is None:
+        args.profile = 'table'
+    if args.pool_strings and not args.whole_program:
+        # Pooled literals take statics, and a class compiled on its own can't know how many the others take
+        parser.error('--pool-strings needs --whole-program')
 
     try:
-        files = files_from_path(args.path)
+        files = files_from_path(args.path, args.recursive, args.include or ['*.jack'], args.exclude)
     except ValueError as err:
         print(f'Error: {str(err)}')
         return -1
 
-    if args.analyze:
-        for obj_path in files:
-            output_path = f'{os.path.splitext(obj_path)[0]}.xml'
-            analyze_file(obj_path, output_path)
+    jobs = args.jobs or os.cpu_count()
+    profiles = None if args.profile is None else []
+    build = partial(build_file, args=args) if profiles is None else partial(profile_file, args=args)
+    if args.whole_program:
+        print_reports(build_program(files, args, profiles))
+    elif jobs == 1:
+        print_reports(collect_reports(map(build, files), profiles))
+    else:
+        # Every class compiles independently into its own file, reports are still printed in order
+        with ProcessPoolExecutor(jobs) as executor:
+            print_reports(collect_reports(executor.map(build, files), profiles))
+
+    if not (args.no_cache or args.stream or args.whole_program):
+        # The cache is only scanned once the whole build is done
+        user_cache().evict()
 
-    for obj_path in files:
-        output_path = f'{os.path.splitext(obj_path)[0]}.vm'
-        compile_file(obj_path, output_path)
+    if profiles is not None:
+        write_profile = PROFILE_WRITERS[args.profile]
+        if args.profile_output is None:
+            write_profile(profiles, sys.stdout)
+        else:
+            with open(args.profile_output, 'w') as profile_obj:
+                write_profile(profiles, profile_obj)
 
     return 0
 
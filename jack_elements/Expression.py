@@ -1,16 +1,75 @@
 from .Variable import Variable
-from typing import Sequence, Union
+from .VmWriter import VmWriter
+from .Instruction import Instruction, Opcode, Segment
+from typing import Callable, Iterable, Iterator, Optional, Sequence, Union
+
+# Jack integers are 16-bit two's complement words
+WORD_BITS = 16
+MAX_CONSTANT = (1 << (WORD_BITS - 1)) - 1
+
+
+def to_word(value: int) -> int:
+    """Wraps an integer around to the range of a 16-bit two's complement word, like the Hack CPU does"""
+    return ((value + MAX_CONSTANT + 1) & ((1 << WORD_BITS) - 1)) - MAX_CONSTANT - 1
 
 
 class Expression:
-    def generate_vm_code(self):
+    def write_vm_code(self, writer: VmWriter) -> None:
         raise NotImplementedError
 
+    def simplify(self, reduce_strength: bool = False) -> 'Expression':
+        """
+        Returns an expression that evaluates to the same value with less code: constant sub-expressions are
+        folded and identities are removed. If reduce_strength is set, expensive operations are also replaced
+        with cheaper ones, even if they take more code. Expressions are never changed in place.
+        """
+        return self
+
+    @property
+    def constant_value(self) -> Optional[int]:
+        """The value of the expression as a 16-bit word if it's known while compiling, None otherwise"""
+        return None
+
+    @property
+    def has_side_effects(self) -> bool:
+        """Whether evaluating the expression may call a subroutine, so it can't be dropped if its value isn't used"""
+        return False
+
+    def children(self) -> Iterable['Expression']:
+        """The sub-expressions of the expression"""
+        return ()
+
+
+def constant_expression(value: int) -> Optional[Expression]:
+    """Returns an expression of a given 16-bit word, or None if no expression evaluates to it in a single term"""
+    if value >= 0:
+        return IntegerConstant(value)
+
+    elif value > -MAX_CONSTANT - 1:
+        return NegateTerm(IntegerConstant(-value))
+
+    else:
+        # -32768 can't be negated from a constant
+        return None
+
+
+def negate_expression(expression: Expression) -> Expression:
+    """Returns an expression of the negated value of an already simplified expression"""
+    if isinstance(expression, NegateTerm):
+        return expression._expression
+
+    return NegateTerm(expression)
+
 
 class Term(Expression):
     pass
 
 
+# OS subroutines that only read their string argument and don't keep it, so a literal passed to them is never
+# changed and can be reused. This only holds for the OS classes, not for classes of the program with the same name
+NON_ESCAPING_STRING_CALLS = frozenset({'Output.printString', 'Keyboard.readLine', 'Keyboard.readInt'})
+
+
 class SubroutineCallTerm(Term):
     _subroutine_name: str
     _expressions: Sequence[Expression]
@@ -23,18 +82,45 @@ class SubroutineCallTerm(Term):
         self._subroutine_name = subroutine_name
         self._expressions = expressions[:]
 
-    def generate_vm_code(self):
-        lines = []
+    def write_vm_code(self, writer: VmWriter) -> None:
         for expression in self._expressions:
             # Push the expression to the stack
-            lines.extend(expression.generate_vm_code())
+            expression.write_vm_code(writer)
 
         # Append the call line
-        lines.append(
-            f'call {self._subroutine_name} {len(self._expressions)}'
-        )
+        writer.call(self._subroutine_name, len(self._expressions))
+
+    def simplify(self, reduce_strength: bool = False) -> 'SubroutineCallTerm':
+        expressions = [expression.simplify(reduce_strength) for expression in self._expressions]
+        return SubroutineCallTerm(self._subroutine_name, expressions)
+
+    @property
+    def has_side_effects(self) -> bool:
+        return True
+
+    @property
+    def subroutine_name(self) -> str:
+        return self._subroutine_name
+
+    def children(self) -> Iterable[Expression]:
+        return self._expressions
+
+    def pool_string_arguments(self, pool: Callable[[str], Optional['StringConstant']]) -> None:
+        """
+        Replaces the string literals that are passed to the call with the constants the pool returns for them.
+        The caller must know that the call never changes or keeps its argument. Literals the pool returns None for
+        are kept.
+        """
+        expressions = []
+        for expression in self._expressions:
+            pooled = pool(expression.value) if type(expression) is StringConstant else None
+            expressions.append(expression if pooled is None else pooled)
+
+        self._expressions = expressions
 
-        return lines
+    def string_arguments(self) -> Iterator[str]:
+        """The values of the string literals that are passed to the call"""
+        return (expression.value for expression in self._expressions if type(expression) is StringConstant)
 
 
 class IntegerConstant(Term):
@@ -47,8 +133,14 @@ class IntegerConstant(Term):
         super().__init__()
         self._value = value
 
-    def generate_vm_code(self):
-        return [f'push constant {self._value}']
+    def write_vm_code(self, writer: VmWriter) -> None:
+        writer.push(Segment.CONSTANT, self._value)
+
+    @property
+    def constant_value(self) -> Optional[int]:
+        # Jack literals are 0..32767, a larger one doesn't fit in a word, so it's written as is and never folded
+        value = to_word(self._value)
+        return value if value == self._value and value >= 0 else None
 
 
 class StringConstant(Term):
@@ -61,23 +153,45 @@ class StringConstant(Term):
         super().__init__()
         self._value = value
 
-    def generate_vm_code(self):
-        lines = [
-            # Allocate string
-            f'push constant {len(self._value)}',
-            'call String.new 1'
-        ]
+    def write_vm_code(self, writer: VmWriter) -> None:
+        # Allocate string
+        writer.push(Segment.CONSTANT, len(self._value))
+        writer.call('String.new', 1)
 
         for char in self._value:
-            lines.extend([
-                # String was alread pushed to the stack
-                f'push constant {ord(char)}',
-                'call String.appendChar 2',
-                # No need to pop return value, it is our string
-            ])
+            # String was alread pushed to the stack
+            writer.push(Segment.CONSTANT, ord(char))
+            writer.call('String.appendChar', 2)
+            # No need to pop return value, it is our string
 
         # Generated string is already in the stack, no need to push anything
-        return lines
+
+    @property
+    def value(self) -> str:
+        return self._value
+
+
+class PooledStringConstant(StringConstant):
+    """
+    A string literal that is built once into a static variable the first time it's evaluated, and reused
+    every time after that.
+    """
+    _variable: Variable
+    _label: str
+
+    def __init__(self, value: str, variable: Variable, label: str):
+        super().__init__(value)
+        self._variable = variable
+        self._label = label
+
+    def write_vm_code(self, writer: VmWriter) -> None:
+        # Statics start as 0, so the string is built only if the variable wasn't set yet
+        writer.write(self._variable.push())
+        writer.if_goto(self._label)
+        super().write_vm_code(writer)
+        writer.write(self._variable.pop())
+        writer.label(self._label)
+        writer.write(self._variable.push())
 
 
 class KeywordConstant(Term):
@@ -92,15 +206,17 @@ class KeywordConstant(Term):
         assert(value in ('true', 'false', 'null'))
         self._value = value
 
-    def generate_vm_code(self):
+    def write_vm_code(self, writer: VmWriter) -> None:
         if self._value == 'true':
-            return [
-                'push constant 1',
-                'neg'
-            ]
+            writer.push(Segment.CONSTANT, 1)
+            writer.write((Opcode.NEG,))
         else:
             assert(self._value in ('false', 'null'))
-            return ['push constant 0']
+            writer.push(Segment.CONSTANT, 0)
+
+    @property
+    def constant_value(self) -> int:
+        return -1 if self._value == 'true' else 0
 
 
 class VariableTerm(Term):
@@ -118,41 +234,48 @@ class VariableTerm(Term):
         self._variable = variable
         self._offset = offset
 
-    def generate_vm_set_code(self):
+    def write_vm_set_code(self, writer: VmWriter) -> None:
         if self._offset is None:
-            return [f'pop {self._variable.VM_SEGMENT} {self._variable.index}']
+            writer.write(self._variable.pop())
 
         else:
-            return [
-                # Add offset to variable value
-                f'push {self._variable.VM_SEGMENT} {self._variable.index}',
-                *self._offset.generate_vm_code(),
-                'add',
+            # Add offset to variable value
+            writer.write(self._variable.push())
+            self._offset.write_vm_code(writer)
+            writer.write((Opcode.ADD,))
 
-                # Set that to point to the result
-                'pop pointer 1',
+            # Set that to point to the result
+            writer.pop(Segment.POINTER, 1)
 
-                # Pop that 0
-                'pop that 0'
-            ]
+            # Pop that 0
+            writer.pop(Segment.THAT, 0)
 
-    def generate_vm_code(self):
-        lines = [f'push {self._variable.VM_SEGMENT} {self._variable.index}']
+    def write_vm_code(self, writer: VmWriter) -> None:
+        writer.write(self._variable.push())
 
         if self._offset is not None:
-            lines.extend([
-                # Add offset to variable value
-                *self._offset.generate_vm_code(),
-                'add',
+            # Add offset to variable value
+            self._offset.write_vm_code(writer)
+            writer.write((Opcode.ADD,))
+
+            # Set that to point to the result
+            writer.pop(Segment.POINTER, 1)
 
-                # Set that to point to the result
-                'pop pointer 1',
+            # Push that 0
+            writer.push(Segment.THAT, 0)
 
-                # Push that 0
-                'push that 0'
-            ])
+    def simplify(self, reduce_strength: bool = False) -> 'VariableTerm':
+        if self._offset is None:
+            return self
 
-        return lines
+        return VariableTerm(self._variable, self._offset.simplify(reduce_strength))
+
+    @property
+    def has_side_effects(self) -> bool:
+        return self._offset is not None and self._offset.has_side_effects
+
+    def children(self) -> Iterable[Expression]:
+        return () if self._offset is None else (self._offset,)
 
 
 class BracketsTerm(Term):
@@ -165,8 +288,23 @@ class BracketsTerm(Term):
         super().__init__()
         self._expression = expression
 
-    def generate_vm_code(self):
-        return self._expression.generate_vm_code()
+    def write_vm_code(self, writer: VmWriter) -> None:
+        self._expression.write_vm_code(writer)
+
+    def simplify(self, reduce_strength: bool = False) -> Expression:
+        # The brackets only group the expression, the generated code is the same without them
+        return self._expression.simplify(reduce_strength)
+
+    @property
+    def constant_value(self) -> Optional[int]:
+        return self._expression.constant_value
+
+    @property
+    def has_side_effects(self) -> bool:
+        return self._expression.has_side_effects
+
+    def children(self) -> Iterable[Expression]:
+        return (self._expression,)
 
 
 class BinaryOperation(Expression):
@@ -174,7 +312,7 @@ class BinaryOperation(Expression):
     _second_expression: Expression
 
     OP = '?'
-    INSTRUCTION = 'inst'
+    INSTRUCTION: Instruction = ()
 
     def __repr__(self):
         return f'{self._first_expression} {self.OP} {self._second_expression}'
@@ -184,19 +322,58 @@ class BinaryOperation(Expression):
         self._first_expression = first_expression
         self._second_expression = second_expression
 
-    def generate_vm_code(self):
-        return [
-            *self._first_expression.generate_vm_code(),
-            *self._second_expression.generate_vm_code(),
-            self.INSTRUCTION
-        ]
+    def write_vm_code(self, writer: VmWriter) -> None:
+        self._first_expression.write_vm_code(writer)
+        self._second_expression.write_vm_code(writer)
+        writer.write(self.INSTRUCTION)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> Optional[int]:
+        """Returns the result of the operation on two words, or None if it can't be computed while compiling"""
+        return None
+
+    def _simplify_identity(self, first: Expression, second: Expression) -> Optional[Expression]:
+        """Returns a simpler expression if one of the simplified operands is an identity of the operation"""
+        return None
+
+    def _reduce_strength(self, first: Expression, second: Expression) -> Optional[Expression]:
+        """Returns a cheaper expression of the operation on the simplified operands, if there is one"""
+        return None
+
+    def simplify(self, reduce_strength: bool = False) -> Expression:
+        first = self._first_expression.simplify(reduce_strength)
+        second = self._second_expression.simplify(reduce_strength)
+
+        first_value = first.constant_value
+        second_value = second.constant_value
+        if first_value is not None and second_value is not None:
+            value = self.evaluate(first_value, second_value)
+            folded = None if value is None else constant_expression(value)
+            if folded is not None:
+                return folded
+
+        simplified = self._simplify_identity(first, second)
+        if simplified is None and reduce_strength:
+            simplified = self._reduce_strength(first, second)
+
+        if simplified is not None:
+            return simplified
+
+        return type(self)(first, second)
+
+    @property
+    def has_side_effects(self) -> bool:
+        return self._first_expression.has_side_effects or self._second_expression.has_side_effects
+
+    def children(self) -> Iterable[Expression]:
+        return self._first_expression, self._second_expression
 
 
 class UnaryOperation(Term):
     _expression: Expression
 
     OP = '?'
-    INSTRUCTION = 'inst'
+    INSTRUCTION: Instruction = ()
 
     def __repr__(self):
         return f'{self.OP}{self._expression}'
@@ -205,11 +382,41 @@ class UnaryOperation(Term):
         super().__init__()
         self._expression = expression
 
-    def generate_vm_code(self):
-        return [
-            *self._expression.generate_vm_code(),
-            self.INSTRUCTION
-        ]
+    def write_vm_code(self, writer: VmWriter) -> None:
+        self._expression.write_vm_code(writer)
+        writer.write(self.INSTRUCTION)
+
+    @staticmethod
+    def evaluate(value: int) -> int:
+        """Returns the result of the operation on a word"""
+        raise NotImplementedError
+
+    def simplify(self, reduce_strength: bool = False) -> Expression:
+        expression = self._expression.simplify(reduce_strength)
+
+        # The operation is its own inverse
+        if isinstance(expression, type(self)):
+            return expression._expression
+
+        value = expression.constant_value
+        if value is not None:
+            folded = constant_expression(self.evaluate(value))
+            if folded is not None:
+                return folded
+
+        return type(self)(expression)
+
+    @property
+    def constant_value(self) -> Optional[int]:
+        value = self._expression.constant_value
+        return None if value is None else self.evaluate(value)
+
+    @property
+    def has_side_effects(self) -> bool:
+        return self._expression.has_side_effects
+
+    def children(self) -> Iterable[Expression]:
+        return (self._expression,)
 
 
 class IntegerBinaryOperation(BinaryOperation):
@@ -230,54 +437,253 @@ class BooleanUnaryOperation(UnaryOperation):
 
 class AddExpression(IntegerBinaryOperation):
     OP = '+'
-    INSTRUCTION = 'add'
+    INSTRUCTION = (Opcode.ADD,)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> int:
+        return to_word(first_value + second_value)
+
+    def _simplify_identity(self, first: Expression, second: Expression) -> Optional[Expression]:
+        if first.constant_value == 0:
+            return second
+        elif second.constant_value == 0:
+            return first
+
+        return None
 
 
 class SubstractExpression(IntegerBinaryOperation):
     OP = '-'
-    INSTRUCTION = 'sub'
+    INSTRUCTION = (Opcode.SUB,)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> int:
+        return to_word(first_value - second_value)
+
+    def _simplify_identity(self, first: Expression, second: Expression) -> Optional[Expression]:
+        if second.constant_value == 0:
+            return first
+        elif first.constant_value == 0:
+            return negate_expression(second)
+
+        return None
 
 
 class MultiplyExpression(IntegerBinaryOperation):
     OP = '*'
-    INSTRUCTION = 'call Math.multiply 2'
+    INSTRUCTION = (Opcode.CALL, 'Math.multiply', 2)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> int:
+        # Math.multiply keeps the lower 16 bits of the product
+        return to_word(first_value * second_value)
+
+    def _simplify_identity(self, first: Expression, second: Expression) -> Optional[Expression]:
+        for constant, other in ((first, second), (second, first)):
+            value = constant.constant_value
+            if value == 1:
+                return other
+            elif value == -1:
+                return negate_expression(other)
+            elif value == 0 and not other.has_side_effects:
+                return IntegerConstant(0)
+
+        return None
+
+    def _reduce_strength(self, first: Expression, second: Expression) -> Optional[Expression]:
+        for constant, other in ((first, second), (second, first)):
+            value = constant.constant_value
+            if value is not None and ShiftAddMultiplication.is_cheaper(value):
+                return ShiftAddMultiplication(other, value)
+
+        return None
+
+
+class ShiftAddMultiplication(Expression):
+    """
+    A multiplication by a constant, that is computed with a sequence of doublings and additions instead of
+    calling Math.multiply. The product is the same, since both keep the lower 16 bits of the product.
+    """
+    _expression: Expression
+    _factor: int
+
+    # The most additions that are generated instead of a call. Every addition but the first also stores and
+    # reloads the accumulator, so longer sequences can run more commands than Math.multiply does for small operands
+    MAX_ADDITIONS = 3
+
+    # Registers in the temp segment, temp 0 is used for dumping the results of do statements
+    OPERAND_REGISTER = 1
+    ACCUMULATOR_REGISTER = 2
+
+    def __repr__(self):
+        return f'{self._expression} * {self._factor}'
+
+    def __init__(self, expression: Expression, factor: int):
+        super().__init__()
+        assert 0 < abs(factor) <= MAX_CONSTANT, f'Multiplying by {factor} is not computed with additions'
+        self._expression = expression
+        self._factor = factor
+
+    @staticmethod
+    def _is_variable(expression: Expression) -> bool:
+        """Whether the operand can be pushed again by a single command"""
+        return isinstance(expression, VariableTerm) and expression._offset is None
+
+    @staticmethod
+    def _additions_count(factor: int) -> int:
+        """
+        How many additions multiplying by the factor takes: a doubling for every bit after the highest one, and an
+        addition of the operand for every one of those bits that is set
+        """
+        bits = bin(abs(factor))[3:]
+        return len(bits) + bits.count('1')
+
+    @classmethod
+    def is_cheaper(cls, factor: int) -> bool:
+        """Whether multiplying by the factor is worth generating a sequence instead of a call"""
+        return 0 < abs(factor) <= MAX_CONSTANT and cls._additions_count(factor) <= cls.MAX_ADDITIONS
+
+    def write_vm_code(self, writer: VmWriter) -> None:
+        if self._is_variable(self._expression):
+            push_operand = self._expression._variable.push()
+        else:
+            self._expression.write_vm_code(writer)
+            writer.pop(Segment.TEMP, self.OPERAND_REGISTER)
+            push_operand = (Opcode.PUSH, Segment.TEMP, self.OPERAND_REGISTER)
+
+        # The bits of the factor from the highest one, which is the operand itself
+        writer.write(push_operand)
+        for i, bit in enumerate(bin(abs(self._factor))[3:]):
+            if i == 0:
+                writer.write(push_operand)
+            else:
+                writer.pop(Segment.TEMP, self.ACCUMULATOR_REGISTER)
+                writer.push(Segment.TEMP, self.ACCUMULATOR_REGISTER)
+                writer.push(Segment.TEMP, self.ACCUMULATOR_REGISTER)
+
+            writer.write((Opcode.ADD,))
+            if bit == '1':
+                writer.write(push_operand)
+                writer.write((Opcode.ADD,))
+
+        if self._factor < 0:
+            writer.write((Opcode.NEG,))
+
+    @property
+    def has_side_effects(self) -> bool:
+        return self._expression.has_side_effects
+
+    def children(self) -> Iterable[Expression]:
+        return (self._expression,)
 
 
 class DivideExpression(IntegerBinaryOperation):
     OP = '/'
-    INSTRUCTION = 'call Math.divide 2'
+    INSTRUCTION = (Opcode.CALL, 'Math.divide', 2)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> Optional[int]:
+        # Division by zero is an error while running, and -32768 has no absolute value as a word
+        if second_value == 0 or MAX_CONSTANT + 1 in (abs(first_value), abs(second_value)):
+            return None
+
+        # Math.divide rounds towards zero
+        quotient = abs(first_value) // abs(second_value)
+        return quotient if (first_value < 0) == (second_value < 0) else -quotient
+
+    @property
+    def has_side_effects(self) -> bool:
+        # Dividing by zero stops the program with an error
+        return super().has_side_effects or self._second_expression.constant_value in (None, 0)
+
+    def _simplify_identity(self, first: Expression, second: Expression) -> Optional[Expression]:
+        value = second.constant_value
+        if value == 1:
+            return first
+        elif value == -1:
+            return negate_expression(first)
+
+        return None
 
 
 class AndExpression(BooleanBinaryOperation):
     OP = '&'
-    INSTRUCTION = 'and'
+    INSTRUCTION = (Opcode.AND,)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> int:
+        return first_value & second_value
+
+    def _simplify_identity(self, first: Expression, second: Expression) -> Optional[Expression]:
+        for constant, other in ((first, second), (second, first)):
+            value = constant.constant_value
+            if value == -1:
+                return other
+            elif value == 0 and not other.has_side_effects:
+                return IntegerConstant(0)
+
+        return None
 
 
 class OrExpression(BooleanBinaryOperation):
     OP = '|'
-    INSTRUCTION = 'or'
+    INSTRUCTION = (Opcode.OR,)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> int:
+        return first_value | second_value
+
+    def _simplify_identity(self, first: Expression, second: Expression) -> Optional[Expression]:
+        for constant, other in ((first, second), (second, first)):
+            value = constant.constant_value
+            if value == 0:
+                return other
+            elif value == -1 and not other.has_side_effects:
+                return constant
+
+        return None
 
 
 class LessThanExpression(BooleanBinaryOperation):
     OP = '<'
-    INSTRUCTION = 'lt'
+    INSTRUCTION = (Opcode.LT,)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> int:
+        return -1 if first_value < second_value else 0
 
 
 class EqualExpression(BooleanBinaryOperation):
     OP = '='
-    INSTRUCTION = 'eq'
+    INSTRUCTION = (Opcode.EQ,)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> int:
+        return -1 if first_value == second_value else 0
 
 
 class GreaterThanExpression(BooleanBinaryOperation):
     OP = '>'
-    INSTRUCTION = 'gt'
+    INSTRUCTION = (Opcode.GT,)
+
+    @staticmethod
+    def evaluate(first_value: int, second_value: int) -> int:
+        return -1 if first_value > second_value else 0
 
 
 class NegateTerm(IntegerUnaryOperation):
     OP = '-'
-    INSTRUCTION = 'neg'
+    INSTRUCTION = (Opcode.NEG,)
+
+    @staticmethod
+    def evaluate(value: int) -> int:
+        return to_word(-value)
 
 
 class NotTerm(BooleanUnaryOperation):
     OP = '~'
-    INSTRUCTION = 'not'
+    INSTRUCTION = (Opcode.NOT,)
+
+    @staticmethod
+    def evaluate(value: int) -> int:
+        return ~value
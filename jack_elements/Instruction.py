@@ -0,0 +1,226 @@
+import sys
+import struct
+from array import array
+from functools import lru_cache
+from enum import IntEnum
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple, Union
+
+
+class Opcode(IntEnum):
+    """The VM commands, the value of a command is the code it is stored with in an InstructionBuffer"""
+    PUSH = 0
+    POP = 1
+    ADD = 2
+    SUB = 3
+    NEG = 4
+    EQ = 5
+    GT = 6
+    LT = 7
+    AND = 8
+    OR = 9
+    NOT = 10
+    LABEL = 11
+    GOTO = 12
+    IF_GOTO = 13
+    FUNCTION = 14
+    CALL = 15
+    RETURN = 16
+
+
+class Segment(IntEnum):
+    """The memory segments of push and pop commands"""
+    CONSTANT = 0
+    ARGUMENT = 1
+    LOCAL = 2
+    STATIC = 3
+    THIS = 4
+    THAT = 5
+    POINTER = 6
+    TEMP = 7
+
+
+# A VM command with its operands: (Opcode.PUSH, Segment.LOCAL, 3), (Opcode.CALL, 'Math.multiply', 2),
+# (Opcode.LABEL, 'LOOP0') or (Opcode.ADD,). Instructions are plain tuples, so they can be compared and hashed.
+Instruction = Tuple[Union[Opcode, Segment, int, str], ...]
+
+OPCODE_NAMES = ('push', 'pop', 'add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not',
+                'label', 'goto', 'if-goto', 'function', 'call', 'return')
+SEGMENT_NAMES = ('constant', 'argument', 'local', 'static', 'this', 'that', 'pointer', 'temp')
+OPCODES = {name: opcode for name, opcode in zip(OPCODE_NAMES, Opcode)}
+SEGMENTS = {name: segment for name, segment in zip(SEGMENT_NAMES, Segment)}
+
+MEMORY_OPCODES = (Opcode.PUSH, Opcode.POP)
+JUMP_OPCODES = (Opcode.GOTO, Opcode.IF_GOTO)
+# Commands whose first operand is a name: a label or a function
+NAMED_OPCODES = (Opcode.LABEL, Opcode.GOTO, Opcode.IF_GOTO, Opcode.FUNCTION, Opcode.CALL)
+
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def parse_instruction(command: str) -> Instruction:
+    """Parses a line of VM code into an instruction"""
+    name, *operands = command.split()
+    opcode = OPCODES[name]
+    if opcode in MEMORY_OPCODES:
+        return opcode, SEGMENTS[operands[0]], int(operands[1])
+    elif opcode in (Opcode.FUNCTION, Opcode.CALL):
+        return opcode, operands[0], int(operands[1])
+    elif opcode in JUMP_OPCODES or opcode == Opcode.LABEL:
+        return opcode, operands[0]
+
+    return (opcode,)
+
+
+# Most instructions repeat many times in a program, so their lines are only formatted once
+@lru_cache(maxsize=4096)
+def format_instruction(instruction: Instruction) -> str:
+    """The text serializer: returns the line of VM code of an instruction"""
+    if len(instruction) == 1:
+        return OPCODE_NAMES[instruction[0]]
+    elif len(instruction) == 2:
+        return f'{OPCODE_NAMES[instruction[0]]} {instruction[1]}'
+    elif instruction[0] in MEMORY_OPCODES:
+        return f'{OPCODE_NAMES[instruction[0]]} {SEGMENT_NAMES[instruction[1]]} {instruction[2]}'
+
+    return f'{OPCODE_NAMES[instruction[0]]} {instruction[1]} {instruction[2]}'
+
+
+# Operands are stored as unsigned 16 bit integers
+MAX_OPERAND = 0xFFFF
+
+
+class InstructionBuffer:
+    """
+    A sequence of instructions, stored in columns instead of as tuples: an array of opcodes and two arrays of
+    small-int operands, from 0 to MAX_OPERAND. Names are interned in a table, and their operand is their index
+    in it. Every instruction takes 5 bytes, while an instruction tuple or a line of VM code takes tens of bytes.
+    """
+    __slots__ = ('opcodes', 'first_operands', 'second_operands', 'name_table', '_name_codes')
+    opcodes: array
+    first_operands: array
+    second_operands: array
+    name_table: List[str]
+    _name_codes: Dict[str, int]
+
+    # A binary VM file starts with the magic, followed by chunks that are written by dump. A chunk is the name
+    # table followed by the columns, every one of them preceded by its length, and every name by its length in
+    # bytes. Names are interned separately in every chunk, so a file can be written a chunk at a time.
+    MAGIC = b'JVMB\x01'
+    _LENGTH = struct.Struct('<I')
+
+    def __init__(self, instructions: Iterable[Instruction] = ()):
+        self.opcodes = array('B')
+        self.first_operands = array('H')
+        self.second_operands = array('H')
+        self.name_table = []
+        self._name_codes = {}
+        self.extend(instructions)
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    def _name_code(self, name: str) -> int:
+        code = self._name_codes.get(name)
+        if code is None:
+            code = self._name_codes[name] = len(self.name_table)
+            self.name_table.append(name)
+
+        return code
+
+    def append(self, instruction: Instruction) -> None:
+        """Adds an instruction to the end of the buffer"""
+        opcode = instruction[0]
+        first = instruction[1] if len(instruction) > 1 else 0
+        if opcode in NAMED_OPCODES:
+            first = self._name_code(first)
+
+        second = instruction[2] if len(instruction) > 2 else 0
+        if not (0 <= first <= MAX_OPERAND and 0 <= second <= MAX_OPERAND):
+            raise ValueError(f'"{format_instruction(instruction)}" has an operand that binary VM code can\'t store, '
+                             f'operands must be between 0 and {MAX_OPERAND}')
+
+        self.opcodes.append(opcode)
+        self.first_operands.append(first)
+        self.second_operands.append(second)
+
+    def extend(self, instructions: Iterable[Instruction]) -> None:
+        """Adds a sequence of instructions to the end of the buffer"""
+        for instruction in instructions:
+            self.append(instruction)
+
+    def __getitem__(self, index: int) -> Instruction:
+        """Creates an instruction tuple for the instruction in the given index"""
+        opcode = Opcode(self.opcodes[index])
+        if opcode in MEMORY_OPCODES:
+            return opcode, Segment(self.first_operands[index]), self.second_operands[index]
+        elif opcode in (Opcode.FUNCTION, Opcode.CALL):
+            return opcode, self.name_table[self.first_operands[index]], self.second_operands[index]
+        elif opcode in NAMED_OPCODES:
+            return opcode, self.name_table[self.first_operands[index]]
+
+        return (opcode,)
+
+    def __iter__(self) -> Iterator[Instruction]:
+        return (self[index] for index in range(len(self)))
+
+    def clear(self) -> None:
+        """Removes all the instructions and the names of the buffer"""
+        for column in (self.opcodes, self.first_operands, self.second_operands):
+            del column[:]
+
+        self.name_table.clear()
+        self._name_codes.clear()
+
+    def dump(self, file_obj: BinaryIO) -> None:
+        """The binary serializer: writes the buffer to a binary VM file as a single chunk"""
+        file_obj.write(self._LENGTH.pack(len(self.name_table)))
+        for name in self.name_table:
+            data = name.encode()
+            file_obj.write(self._LENGTH.pack(len(data)) + data)
+
+        for column in (self.opcodes, self.first_operands, self.second_operands):
+            file_obj.write(self._LENGTH.pack(len(column)))
+            if _BIG_ENDIAN:
+                # Columns are always stored in little endian
+                column = array(column.typecode, column)
+                column.byteswap()
+
+            file_obj.write(column.tobytes())
+
+    @classmethod
+    def load(cls, file_obj: BinaryIO) -> 'InstructionBuffer':
+        """Reads all the chunks of a binary VM file into a single buffer"""
+        if file_obj.read(len(cls.MAGIC)) != cls.MAGIC:
+            raise ValueError('Not a binary VM file')
+
+        def read_length() -> int:
+            return cls._LENGTH.unpack(file_obj.read(cls._LENGTH.size))[0]
+
+        buffer = cls()
+        while True:
+            header = file_obj.read(cls._LENGTH.size)
+            if not header:
+                break
+
+            names_count = cls._LENGTH.unpack(header)[0]
+            name_codes = [buffer._name_code(file_obj.read(read_length()).decode()) for _ in range(names_count)]
+
+            columns = []
+            for typecode in ('B', 'H', 'H'):
+                column = array(typecode)
+                column.frombytes(file_obj.read(read_length() * column.itemsize))
+                if _BIG_ENDIAN:
+                    column.byteswap()
+
+                columns.append(column)
+
+            opcodes, first_operands, second_operands = columns
+            for index, opcode in enumerate(opcodes):
+                if opcode in NAMED_OPCODES:
+                    first_operands[index] = name_codes[first_operands[index]]
+
+            buffer.opcodes.extend(opcodes)
+            buffer.first_operands.extend(first_operands)
+            buffer.second_operands.extend(second_operands)
+
+        return buffer
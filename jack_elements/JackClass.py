@@ -1,7 +1,14 @@
-from typing import Mapping
+from typing import Collection, Dict, Mapping, Optional, Sequence, TextIO
+from .Syntax import SyntaxElement
 from .Variable import Variable, Static, Field, This
 from .JackSubroutine import JackSubroutine, JackConstructor, JackFunction, JackMethod
+from .Expression import SubroutineCallTerm, PooledStringConstant, NON_ESCAPING_STRING_CALLS
+from .Statement import WhileStatement, walk
+from .VmWriter import VmWriter
+from .LabelAllocator import LabelAllocator
+from collections import Counter
 from itertools import chain
+import sys
 
 
 class JackClass:
@@ -9,6 +16,8 @@ class JackClass:
     _statics: Mapping[str, Static]
     _fields: Mapping[str, Field]
     _this: This
+    _symbols: Dict[str, Variable]
+    syntax: Optional[SyntaxElement]
 
     def __init__(self, name: str):
         self._name = name
@@ -17,16 +26,18 @@ class JackClass:
         self._subroutines = []
         self._this = This('this', name, 0)
 
+        # All the symbols of the class by their name, so every one of them is resolved with a single lookup
+        self._symbols = {'this': self._this}
+
+        # The concrete syntax the class was parsed from, if the parser was asked to retain it
+        self.syntax = None
+
     def __getitem__(self, key) -> Variable:
         """Return a static variable or a field variable that was added before"""
-        if key == 'this':
-            return self._this
-        elif key in self._statics:
-            return self._statics[key]
-        elif key in self._fields:
-            return self._fields[key]
-        else:
-            raise KeyError(f'{key} was not defined in this class')
+        try:
+            return self._symbols[key]
+        except KeyError:
+            raise KeyError(f'{key} was not defined in this class') from None
 
     def __iter__(self):
         """Iterate over all variable names in scope"""
@@ -36,19 +47,34 @@ class JackClass:
     def name(self):
         return self._name
 
+    @property
+    def symbols(self) -> Mapping[str, Variable]:
+        """All the symbols of the class by their name: this, the static variables and the field variables"""
+        return self._symbols
+
+    @property
+    def statics(self) -> Mapping[str, Static]:
+        return self._statics
+
+    @property
+    def subroutines(self) -> Sequence[JackSubroutine]:
+        return self._subroutines
+
     def add_static(self, name: str, var_type: str) -> None:
         """Add a static variable to the class"""
         if name in self._statics or name in self._fields:
             raise ValueError(f'{name} was already defined')
 
-        self._statics[name] = Static(name, var_type, len(self._statics))
+        name = sys.intern(name)
+        self._statics[name] = self._symbols[name] = Static(name, var_type, len(self._statics))
 
     def add_field(self, name: str, var_type: str) -> None:
         """Add a field variable to the class"""
         if name in self._statics or name in self._fields:
             raise ValueError(f'{name} was already defined')
 
-        self._fields[name] = Field(name, var_type, len(self._fields))
+        name = sys.intern(name)
+        self._fields[name] = self._symbols[name] = Field(name, var_type, len(self._fields))
 
     def add_variable(self, kind: str, name: str, var_type: str) -> None:
         """Add a static/field variable to the class"""
@@ -72,6 +98,69 @@ class JackClass:
         self._subroutines.append(subroutine)
         return subroutine
 
-    def generate_vm_code(self) -> str:
-        subroutines_code = ['\n'.join(subroutine.generate_vm_code()) for subroutine in self._subroutines]
-        return '\n'.join(subroutines_code)
+    def write_vm_code(self, writer: VmWriter, label_map: Optional[TextIO] = None) -> None:
+        """
+        Writes the VM code of all the subroutines of the class, one after the other.
+        If label_map is given, the positions of the statements the labels belong to are written to it.
+        """
+        labels = LabelAllocator(label_map)
+        for subroutine in self._subroutines:
+            subroutine.write_vm_code(writer, labels)
+
+    def optimize(self, reduce_strength: bool = False) -> None:
+        """Simplifies the code of all the subroutines of the class in place"""
+        for subroutine in self._subroutines:
+            subroutine.optimize(reduce_strength)
+
+    def pool_strings(self, max_strings: int, calls: Collection[str] = NON_ESCAPING_STRING_CALLS) -> int:
+        """
+        Replaces the string literals that are passed to the given calls, which must only read them, with literals
+        that are built once into a static variable. Every distinct literal takes a static variable, at most
+        max_strings literals of the class are pooled.
+        Only literals that are built more than once are pooled, since a pooled literal checks its variable every
+        time and costs more than a literal that is built once. A literal in a loop counts as built more than once.
+        The statics of all the classes of a program share a small segment, which a single class can't budget,
+        so literals are pooled through JackProgram.pool_strings, within the words the segment has left.
+        Returns how many literals were replaced.
+        """
+        pooled_calls = []
+        for subroutine in self._subroutines:
+            in_loops = {id(node) for loop in subroutine.walk() if isinstance(loop, WhileStatement)
+                        for node in walk(loop.children())}
+            pooled_calls += [(node, id(node) in in_loops) for node in subroutine.walk()
+                             if isinstance(node, SubroutineCallTerm) and node.subroutine_name in calls]
+
+        builds = Counter()
+        for call, in_loop in pooled_calls:
+            for value in call.string_arguments():
+                builds[value] += 2 if in_loop else 1
+
+        variables = {}
+        replaced = 0
+
+        def pool(value: str) -> Optional[PooledStringConstant]:
+            nonlocal replaced
+            if builds[value] < 2:
+                return None
+
+            if value not in variables:
+                if len(variables) >= max_strings:
+                    return None
+
+                # Quotes can't be a part of an identifier, so the name never hides a static of the class
+                name = f'"{value}"'
+                self.add_static(name, 'String')
+                variables[value] = self._statics[name]
+
+            replaced += 1
+            variable = variables[value]
+            return PooledStringConstant(value, variable, f'STRING{variable.index}.{replaced}')
+
+        for call, _ in pooled_calls:
+            call.pool_string_arguments(pool)
+
+        return replaced
+
+    def prune(self, reachable: Collection[str]) -> None:
+        """Removes the subroutines whose full names aren't in reachable, so no VM code is generated for them"""
+        self._subroutines = [subroutine for subroutine in self._subroutines if subroutine.full_name in reachable]
@@ -0,0 +1,85 @@
+from .JackClass import JackClass
+from .Expression import NON_ESCAPING_STRING_CALLS
+from typing import Dict, Iterable, Set
+
+
+class JackProgram:
+    """
+    All the parsed classes of a program, for optimizations that need to see the whole program.
+    """
+    _classes: Dict[str, JackClass]
+
+    ENTRY_POINT = 'Main.main'
+    # The static variables of all the classes share RAM[16..255]
+    STATIC_SEGMENT_SIZE = 240
+
+    def __init__(self, classes: Iterable[JackClass] = ()):
+        self._classes = {}
+        for jack_class in classes:
+            self.add_class(jack_class)
+
+    def add_class(self, jack_class: JackClass) -> None:
+        if jack_class.name in self._classes:
+            raise ValueError(f'{jack_class.name} was already defined')
+
+        self._classes[jack_class.name] = jack_class
+
+    def reachable_subroutines(self, entry_point: str = ENTRY_POINT) -> Set[str]:
+        """
+        Returns the full names of the subroutines that may run when the program starts from the entry point.
+        Calls to subroutines that aren't a part of the program, like the OS ones, are ignored.
+        """
+        call_graph = {subroutine.full_name: subroutine
+                      for jack_class in self._classes.values() for subroutine in jack_class.subroutines}
+
+        reachable = set()
+        pending = [entry_point]
+        while pending:
+            name = pending.pop()
+            if name in reachable or name not in call_graph:
+                continue
+
+            reachable.add(name)
+            pending.extend(call_graph[name].called_subroutines())
+
+        return reachable
+
+    def prune(self, entry_point: str = ENTRY_POINT) -> int:
+        """
+        Removes the subroutines that can't run when the program starts from the entry point, and returns how
+        many were removed. A program without the entry point is a library, so nothing is removed from it.
+        """
+        reachable = self.reachable_subroutines(entry_point)
+        if not reachable:
+            return 0
+
+        removed = 0
+        for jack_class in self._classes.values():
+            count = len(jack_class.subroutines)
+            jack_class.prune(reachable)
+            removed += count - len(jack_class.subroutines)
+
+        return removed
+
+    def pool_strings(self) -> int:
+        """
+        Pools the string literals of all the classes like JackClass.pool_strings, for the OS calls of classes the
+        program doesn't define itself, and only within the words of the static segment that the statics of the
+        classes left free, so the statics of the whole program still fit in the segment.
+        The classes get the free words in the order they were added.
+        Returns how many literals were replaced.
+        """
+        # A class of the program, such as an Output of the student's OS, replaces the OS class of the same name,
+        # and might change or keep the strings passed to it
+        calls = frozenset(name for name in NON_ESCAPING_STRING_CALLS if name.split('.')[0] not in self._classes)
+        free = self.STATIC_SEGMENT_SIZE - sum(len(jack_class.statics) for jack_class in self._classes.values())
+        replaced = 0
+        for jack_class in self._classes.values():
+            if free <= 0:
+                break
+
+            count = len(jack_class.statics)
+            replaced += jack_class.pool_strings(free, calls)
+            free -= len(jack_class.statics) - count
+
+        return replaced
@@ -1,7 +1,12 @@
-from .Variable import Local, Argument
-from .Statement import Statement
-from typing import Mapping, Sequence
+from .Variable import Variable, Local, Argument
+from .Statement import Statement, optimize_statements, walk
+from .Expression import Expression, SubroutineCallTerm
+from .VmWriter import VmWriter
+from .Instruction import Instruction, Opcode, Segment
+from .LabelAllocator import LabelAllocator
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Set, Union
 from itertools import chain
+import sys
 
 
 class JackSubroutine:
@@ -9,6 +14,7 @@ class JackSubroutine:
     _return_type: str
     _arguments: Mapping[str, Argument]
     _locals: Mapping[str, Local]
+    _symbols: Dict[str, Variable]
     _statements: Sequence[Statement]
 
     def __init__(self, name: str, return_type: str, jack_class):
@@ -19,64 +25,89 @@ class JackSubroutine:
         self._locals = {}
         self._statements = []
 
+        # Every symbol in the scope of the subroutine by its name, so it's resolved with a single lookup: the
+        # symbols of the class, shadowed by the arguments and the locals as they're added. The variables of a
+        # class are all declared before its subroutines, so the class has all of them by now
+        self._symbols = dict(jack_class.symbols)
+
     def __repr__(self):
         arguments = ", ".join(f"{argument.type} {argument.name}" for argument in self._arguments.values())
         return f'{self._return_type} {self._name}({arguments})'
 
     def __getitem__(self, key):
         """Return a symbol in the function's scope"""
-        if key in self._arguments:
-            return self._arguments[key]
-        elif key in self._locals:
-            return self._locals[key]
-        else:
-            return self._jack_class[key]
+        try:
+            return self._symbols[key]
+        except KeyError:
+            raise KeyError(f'{key} was not defined in this subroutine') from None
+
+    def __contains__(self, key) -> bool:
+        """Whether a symbol is in the function's scope"""
+        return key in self._symbols
 
     def __iter__(self):
         """Iterate over all variable names in scope"""
         return iter(chain(self._arguments, self._locals, self._jack_class))
 
+    def get(self, key: str) -> Optional[Variable]:
+        """Return a symbol in the function's scope, or None if it wasn't defined"""
+        return self._symbols.get(key)
+
     def add_argument(self, name: str, var_type: str) -> None:
         """Add a argument variable to the class"""
         if name in self._arguments or name in self._locals:
             raise ValueError(f'{name} was already defined')
 
-        self._arguments[name] = Argument(name, var_type, len(self._arguments))
+        name = sys.intern(name)
+        self._arguments[name] = self._symbols[name] = Argument(name, var_type, len(self._arguments))
 
     def add_local(self, name: str, var_type: str) -> None:
         """Add a local variable to the class"""
         if name in self._arguments or name in self._locals:
             raise ValueError(f'{name} was already defined')
 
-        self._locals[name] = Local(name, var_type, len(self._locals))
+        name = sys.intern(name)
+        self._locals[name] = self._symbols[name] = Local(name, var_type, len(self._locals))
 
     def add_statements(self, statements: Sequence[Statement]):
         """Add a sequence of parsed statements to the subroutine's statements"""
         self._statements.extend(statements)
 
-    def generate_vm_code(self):
-        lines = [
-            f'function {self._jack_class.name}.{self._name} {len(self._locals)}',
-            *self._PROLOGUE,
-        ]
+    def write_vm_code(self, writer: VmWriter, labels: LabelAllocator) -> None:
+        writer.write((Opcode.FUNCTION, self.full_name, len(self._locals)))
+        writer.write_all(self._PROLOGUE)
 
-        for i, statement in enumerate(self._statements):
-            lines.extend(statement.generate_vm_code(str(i)))
+        labels.start_function(self.full_name)
+        for statement in self._statements:
+            statement.write_vm_code(writer, labels)
 
-        return lines
+    def optimize(self, reduce_strength: bool = False) -> None:
+        """Simplifies the code of the subroutine in place"""
+        self._statements = optimize_statements(self._statements, reduce_strength)
+
+    @property
+    def full_name(self) -> str:
+        """The name of the subroutine as it's called in VM code"""
+        return f'{self._jack_class.name}.{self._name}'
+
+    def walk(self) -> Iterator[Union[Statement, Expression]]:
+        """Iterates over all the statements and the expressions of the subroutine"""
+        return walk(self._statements)
+
+    def called_subroutines(self) -> Set[str]:
+        """The full names of all the subroutines the subroutine calls"""
+        return {node.subroutine_name for node in self.walk() if isinstance(node, SubroutineCallTerm)}
 
 
 class JackConstructor(JackSubroutine):
     @property
-    def _PROLOGUE(self) -> str:
-        lines = [
-            f'push constant {len(self._jack_class._fields)}',
-            'call Memory.alloc 1',
-            'pop pointer 0'
+    def _PROLOGUE(self) -> List[Instruction]:
+        return [
+            (Opcode.PUSH, Segment.CONSTANT, len(self._jack_class._fields)),
+            (Opcode.CALL, 'Memory.alloc', 1),
+            (Opcode.POP, Segment.POINTER, 0)
         ]
 
-        return lines
-
 
 class JackFunction(JackSubroutine):
     _PROLOGUE = []
@@ -84,8 +115,8 @@ class JackFunction(JackSubroutine):
 
 class JackMethod(JackSubroutine):
     _PROLOGUE = [
-        'push argument 0',
-        'pop pointer 0'
+        (Opcode.PUSH, Segment.ARGUMENT, 0),
+        (Opcode.POP, Segment.POINTER, 0)
     ]
 
     def __init__(self, name: str, return_type: str, jack_class):
@@ -0,0 +1,40 @@
+from typing import Optional, TextIO
+
+
+class LabelAllocator:
+    """
+    Numbers the control flow statements of every subroutine, so their labels are short and unique: the labels
+    of a statement are its kind followed by its number, like IF_TRUE3 and IF_END3.
+    Labels are local to their function in VM code, so every subroutine counts its statements from 0.
+
+    If a label map file is given, a line with the position in the source of every numbered statement is
+    written to it, so the labels of the VM code can be traced back to the Jack code. Lines and columns are
+    counted from 0, like in the errors reports:
+        Main.main 3 12:8
+    """
+    _function_name: str
+    _count: int
+    _label_map: Optional[TextIO]
+
+    def __init__(self, label_map: Optional[TextIO] = None):
+        self._function_name = ''
+        self._count = 0
+        self._label_map = label_map
+
+    def start_function(self, function_name: str) -> None:
+        """Starts numbering the statements of another subroutine"""
+        self._function_name = function_name
+        self._count = 0
+
+    def allocate(self, token=None) -> int:
+        """
+        Returns the number of the next statement. token is the keyword token of the statement, its position is
+        only looked up when there's a label map.
+        """
+        index = self._count
+        self._count += 1
+        if self._label_map is not None and token is not None:
+            position = token.position
+            self._label_map.write(f'{self._function_name} {index} {position["line"]}:{position["column"]}\n')
+
+        return index
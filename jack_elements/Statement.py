@@ -1,12 +1,54 @@
 from .Expression import Expression, SubroutineCallTerm, VariableTerm
-from typing import Sequence, Union
-from itertools import chain
+from .VmWriter import VmWriter
+from .Instruction import Opcode, Segment
+from .LabelAllocator import LabelAllocator
+from typing import Iterable, Iterator, List, Sequence, Union
 
 
 class Statement:
-    def generate_vm_code(self, statement_indicator: str):
+    # The keyword token of the statement, for the statements that have labels
+    token = None
+
+    def write_vm_code(self, writer: VmWriter, labels: LabelAllocator) -> None:
+        raise NotImplementedError
+
+    def optimize(self, reduce_strength: bool = False) -> Sequence['Statement']:
+        """
+        Simplifies the expressions of the statement in place, and returns the statements that replace it:
+        branches whose condition is constant are replaced with the statements that actually run.
+        """
+        raise NotImplementedError
+
+    def children(self) -> Iterable[Union['Statement', Expression]]:
+        """The statements and the expressions the statement consists of"""
         raise NotImplementedError
 
+    @property
+    def is_terminal(self) -> bool:
+        """Whether the statements after this one can never run"""
+        return False
+
+
+def optimize_statements(statements: Sequence[Statement], reduce_strength: bool = False) -> List[Statement]:
+    """Optimizes a sequence of statements, and removes the statements that can never run"""
+    optimized = []
+    for statement in statements:
+        for replacement in statement.optimize(reduce_strength):
+            optimized.append(replacement)
+            if replacement.is_terminal:
+                return optimized
+
+    return optimized
+
+
+def walk(nodes: Iterable[Union[Statement, Expression]]) -> Iterator[Union[Statement, Expression]]:
+    """Iterates over the given statements and expressions, and everything they consist of"""
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.children())
+
 
 class IfStatement(Statement):
     _condition: Expression
@@ -20,34 +62,51 @@ class IfStatement(Statement):
             return f'if ({self._condition}) {{...}} else {{...}}'
 
     def __init__(self, condition: Expression, true_statements: Sequence[Statement],
-                 false_statements: Union[Sequence[Statement], None] = None):
+                 false_statements: Union[Sequence[Statement], None] = None, token=None):
         super().__init__()
         self._condition = condition
         self._true_statements = true_statements
         self._false_statements = false_statements
+        self.token = token
 
-    def generate_vm_code(self, statement_indicator: str):
-        # Create lists of generated statements
-        true_statements = list(chain(*[statement.generate_vm_code(f'{statement_indicator}.T{i}')
-                                       for i, statement in enumerate(self._true_statements)]))
-        if self._false_statements is None:
-            false_statements = list()
+    def write_vm_code(self, writer: VmWriter, labels: LabelAllocator) -> None:
+        # Fill condition, false_statements, true_statements in the if-template
+        index = labels.allocate(self.token)
+        self._condition.write_vm_code(writer)
+        writer.if_goto(f'IF_TRUE{index}')
+        if self._false_statements is not None:
+            for statement in self._false_statements:
+                statement.write_vm_code(writer, labels)
+
+        writer.goto(f'IF_END{index}')
+        writer.label(f'IF_TRUE{index}')
+        for statement in self._true_statements:
+            statement.write_vm_code(writer, labels)
+
+        writer.label(f'IF_END{index}')
+
+    def optimize(self, reduce_strength: bool = False) -> Sequence[Statement]:
+        self._condition = self._condition.simplify(reduce_strength)
+        self._true_statements = optimize_statements(self._true_statements, reduce_strength)
+        if self._false_statements is not None:
+            self._false_statements = optimize_statements(self._false_statements, reduce_strength)
+
+        condition = self._condition.constant_value
+        if condition is None:
+            return [self]
+        elif condition != 0:
+            return self._true_statements
         else:
-            false_statements = list(chain(*[statement.generate_vm_code(f'{statement_indicator}.F{i}')
-                                            for i, statement in enumerate(self._false_statements)]))
+            return self._false_statements or []
 
-        # Fill condition, false_statements, true_statements in the if-template
-        lines = [
-            *self._condition.generate_vm_code(),
-            f'if-goto IF_TRUE{statement_indicator}',
-            *false_statements,
-            f'goto IF_END{statement_indicator}',
-            f'label IF_TRUE{statement_indicator}',
-            *true_statements,
-            f'label IF_END{statement_indicator}'
-        ]
+    def children(self) -> Iterable[Union[Statement, Expression]]:
+        return [self._condition, *self._true_statements, *(self._false_statements or [])]
 
-        return lines
+    @property
+    def is_terminal(self) -> bool:
+        return self._false_statements is not None \
+            and all(statements and statements[-1].is_terminal
+                    for statements in (self._true_statements, self._false_statements))
 
 
 class LetStatement(Statement):
@@ -62,14 +121,20 @@ class LetStatement(Statement):
         self._variable_term = variable_term
         self._value = value
 
-    def generate_vm_code(self, statement_indicator: str):
-        return [
-            # Push the evaluated expression to the stack
-            *self._value.generate_vm_code(),
+    def write_vm_code(self, writer: VmWriter, labels: LabelAllocator) -> None:
+        # Push the evaluated expression to the stack
+        self._value.write_vm_code(writer)
+
+        # Pop it to that variable
+        self._variable_term.write_vm_set_code(writer)
 
-            # Pop it to that variable
-            *self._variable_term.generate_vm_set_code()
-        ]
+    def optimize(self, reduce_strength: bool = False) -> Sequence[Statement]:
+        self._variable_term = self._variable_term.simplify(reduce_strength)
+        self._value = self._value.simplify(reduce_strength)
+        return [self]
+
+    def children(self) -> Iterable[Union[Statement, Expression]]:
+        return [self._variable_term, self._value]
 
 
 class WhileStatement(Statement):
@@ -79,28 +144,42 @@ class WhileStatement(Statement):
     def __repr__(self):
         return f'while ({self._condition}) {{...}}'
 
-    def __init__(self, condition: Expression, statements: Sequence[Statement]):
+    def __init__(self, condition: Expression, statements: Sequence[Statement], token=None):
         super().__init__()
         self._condition = condition
         self._statements = statements
+        self.token = token
 
-    def generate_vm_code(self, statement_indicator: str):
-        # Create lists of generated statements
-        statements = list(chain(*[statement.generate_vm_code(f'{statement_indicator}.{i}')
-                                  for i, statement in enumerate(self._statements)]))
-
+    def write_vm_code(self, writer: VmWriter, labels: LabelAllocator) -> None:
         # Fill condition and statements in the while-template
-        lines = [
-            f'label LOOP{statement_indicator}',
-            *self._condition.generate_vm_code(),
-            'not',
-            f'if-goto LOOP_END{statement_indicator}',
-            *statements,
-            f'goto LOOP{statement_indicator}',
-            f'label LOOP_END{statement_indicator}'
-        ]
+        index = labels.allocate(self.token)
+        writer.label(f'LOOP{index}')
+        self._condition.write_vm_code(writer)
+        writer.write((Opcode.NOT,))
+        writer.if_goto(f'LOOP_END{index}')
+        for statement in self._statements:
+            statement.write_vm_code(writer, labels)
+
+        writer.goto(f'LOOP{index}')
+        writer.label(f'LOOP_END{index}')
+
+    def optimize(self, reduce_strength: bool = False) -> Sequence[Statement]:
+        self._condition = self._condition.simplify(reduce_strength)
+        self._statements = optimize_statements(self._statements, reduce_strength)
+
+        if self._condition.constant_value == 0:
+            return []
+
+        return [self]
+
+    def children(self) -> Iterable[Union[Statement, Expression]]:
+        return [self._condition, *self._statements]
 
-        return lines
+    @property
+    def is_terminal(self) -> bool:
+        # There are no breaks in Jack, so a loop with a true condition only ends by returning
+        value = self._condition.constant_value
+        return value is not None and value != 0
 
 
 class DoStatement(Statement):
@@ -113,12 +192,17 @@ class DoStatement(Statement):
         super().__init__()
         self._call_term = call_term
 
-    def generate_vm_code(self, statement_indicator: str):
+    def write_vm_code(self, writer: VmWriter, labels: LabelAllocator) -> None:
         # Evaluate the call term, and then dump its result
-        return [
-            *self._call_term.generate_vm_code(),
-            'pop temp 0'
-        ]
+        self._call_term.write_vm_code(writer)
+        writer.pop(Segment.TEMP, 0)
+
+    def optimize(self, reduce_strength: bool = False) -> Sequence[Statement]:
+        self._call_term = self._call_term.simplify(reduce_strength)
+        return [self]
+
+    def children(self) -> Iterable[Union[Statement, Expression]]:
+        return [self._call_term]
 
 
 class ReturnStatement(Statement):
@@ -134,15 +218,24 @@ class ReturnStatement(Statement):
         super().__init__()
         self._expression = expression
 
-    def generate_vm_code(self, statement_indicator: str):
+    def write_vm_code(self, writer: VmWriter, labels: LabelAllocator) -> None:
         # Push the return value and return
         if self._expression is None:
-            return [
-                'push constant 0',
-                'return'
-            ]
+            writer.push(Segment.CONSTANT, 0)
         else:
-            return [
-                *self._expression.generate_vm_code(),
-                'return'
-            ]
+            self._expression.write_vm_code(writer)
+
+        writer.write((Opcode.RETURN,))
+
+    def optimize(self, reduce_strength: bool = False) -> Sequence[Statement]:
+        if self._expression is not None:
+            self._expression = self._expression.simplify(reduce_strength)
+
+        return [self]
+
+    def children(self) -> Iterable[Union[Statement, Expression]]:
+        return [] if self._expression is None else [self._expression]
+
+    @property
+    def is_terminal(self) -> bool:
+        return True
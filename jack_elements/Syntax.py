@@ -0,0 +1,69 @@
+from typing import List, Tuple, Union
+
+
+class SyntaxElement:
+    """
+    A parsed element of the Jack grammar (a class, a statement, a term etc.), that retains the concrete
+    syntax it was parsed from: its children are tokens, as (type, value) tuples, and nested elements.
+    """
+    __slots__ = ('type', 'children')
+    type: str
+    children: List[Union['SyntaxElement', Tuple[str, str]]]
+
+    def __repr__(self):
+        return f'<{self.type}>'
+
+    def __init__(self, element_type: str):
+        self.type = element_type
+        self.children = []
+
+
+class SyntaxBuilder:
+    """
+    Builds a SyntaxElement tree while parsing.
+    Has the same interface XmlWriter has, elements are opened with a context manager:
+        with builder.element('term'):
+            builder.add_token('integerConstant', '5')
+    """
+    _root: SyntaxElement
+    _stack: List[SyntaxElement]
+
+    def __init__(self):
+        # The root is a placeholder that holds the top level element
+        self._root = SyntaxElement('')
+        self._stack = [self._root]
+
+    @property
+    def root(self) -> Union[SyntaxElement, None]:
+        """The top level element that was built, or None if no element was started"""
+        return self._root.children[0] if self._root.children else None
+
+    def element(self, element_type: str) -> '_SyntaxElementContext':
+        """Returns a context manager that adds everything inside it to a new element"""
+        return _SyntaxElementContext(self, element_type)
+
+    def add_token(self, token_type: str, value: str) -> None:
+        """Adds a token to the current element"""
+        self._stack[-1].children.append((token_type, value))
+
+    def _start_element(self, element_type: str) -> None:
+        element = SyntaxElement(element_type)
+        self._stack[-1].children.append(element)
+        self._stack.append(element)
+
+    def _close_element(self) -> None:
+        self._stack.pop()
+
+
+class _SyntaxElementContext:
+    def __init__(self, builder: SyntaxBuilder, element_type: str):
+        self._builder = builder
+        self._type = element_type
+
+    def __enter__(self) -> '_SyntaxElementContext':
+        self._builder._start_element(self._type)
+        return self
+
+    def __exit__(self, *exception) -> bool:
+        self._builder._close_element()
+        return False
@@ -1,8 +1,12 @@
+from .Instruction import Instruction, Opcode, Segment
+
+
 class Variable:
+    __slots__ = ('_name', '_type', '_index')
     _name: str
     _type: str
     _index: int
-    VM_SEGMENT: str
+    VM_SEGMENT: Segment
 
     def __init__(self, name: str, type: str, index: int):
         self._name = name
@@ -24,32 +28,33 @@ class Variable:
     def __str__(self):
         return f'{self.name}'
 
-    @property
-    def _vm_reference(self):
-        return f'{self.VM_SEGMENT} {self.index}'
-
-    def push(self):
-        return f'push {self._vm_reference}'
+    def push(self) -> Instruction:
+        return Opcode.PUSH, self.VM_SEGMENT, self._index
 
-    def pop(self):
-        return f'pop {self._vm_reference}'
+    def pop(self) -> Instruction:
+        return Opcode.POP, self.VM_SEGMENT, self._index
 
 
 class Field(Variable):
-    VM_SEGMENT = 'this'
+    __slots__ = ()
+    VM_SEGMENT = Segment.THIS
 
 
 class Static(Variable):
-    VM_SEGMENT = 'static'
+    __slots__ = ()
+    VM_SEGMENT = Segment.STATIC
 
 
 class Local(Variable):
-    VM_SEGMENT = 'local'
+    __slots__ = ()
+    VM_SEGMENT = Segment.LOCAL
 
 
 class Argument(Variable):
-    VM_SEGMENT = 'argument'
+    __slots__ = ()
+    VM_SEGMENT = Segment.ARGUMENT
 
 
 class This(Variable):
-    VM_SEGMENT = 'pointer'
+    __slots__ = ()
+    VM_SEGMENT = Segment.POINTER
@@ -0,0 +1,100 @@
+from .Instruction import Instruction, InstructionBuffer, Opcode, Segment, format_instruction
+from typing import BinaryIO, IO, Iterable, List
+import io
+
+
+class VmWriter:
+    """
+    A buffered sink of VM instructions, that the parsed elements write their code to while they are visited.
+    Instructions are written to the file in batches, so only a batch of the class' code is held in memory at once.
+    This writer serializes them as VM code text. Its files are opened in binary mode, and every batch is encoded
+    and written at once, but a text file (like a StringIO) may be given too.
+    """
+    _file_obj: IO
+    _buffer: List[Instruction]
+    _buffer_size: int
+    _separator: str
+    _encode: bool
+    # The number of instructions that were written to the file so far
+    written: int
+
+    # The extension of the files the writer writes, and the mode they are opened with
+    EXTENSION = '.vm'
+    FILE_MODE = 'wb'
+
+    def __init__(self, file_obj: IO, buffer_size: int = 4096):
+        self._file_obj = file_obj
+        self._buffer = []
+        self._buffer_size = buffer_size
+
+        # Commands are separated by new lines, with no new line after the last one
+        self._separator = ''
+        self._encode = not isinstance(file_obj, io.TextIOBase)
+        self.written = 0
+
+    def write(self, instruction: Instruction) -> None:
+        """Writes a single VM instruction"""
+        self._buffer.append(instruction)
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def write_all(self, instructions: Iterable[Instruction]) -> None:
+        """Writes a sequence of VM instructions"""
+        for instruction in instructions:
+            self.write(instruction)
+
+    def push(self, segment: Segment, index: int) -> None:
+        self.write((Opcode.PUSH, segment, index))
+
+    def pop(self, segment: Segment, index: int) -> None:
+        self.write((Opcode.POP, segment, index))
+
+    def label(self, label: str) -> None:
+        self.write((Opcode.LABEL, label))
+
+    def goto(self, label: str) -> None:
+        self.write((Opcode.GOTO, label))
+
+    def if_goto(self, label: str) -> None:
+        self.write((Opcode.IF_GOTO, label))
+
+    def call(self, function_name: str, arguments_count: int) -> None:
+        self.write((Opcode.CALL, function_name, arguments_count))
+
+    def flush(self) -> None:
+        """Writes the buffered instructions to the file"""
+        if self._buffer:
+            code = self._separator + '\n'.join(map(format_instruction, self._buffer))
+            self._file_obj.write(code.encode() if self._encode else code)
+            self.written += len(self._buffer)
+            self._separator = '\n'
+            self._buffer.clear()
+
+
+class BinaryVmWriter(VmWriter):
+    """A VmWriter that serializes the instructions to a binary VM file, a chunk for every batch"""
+    _file_obj: BinaryIO
+    _instructions: InstructionBuffer
+    _header: bytes
+
+    EXTENSION = '.vmb'
+    FILE_MODE = 'wb'
+
+    def __init__(self, file_obj: BinaryIO, buffer_size: int = 4096):
+        super().__init__(file_obj, buffer_size)
+        self._instructions = InstructionBuffer()
+        self._header = InstructionBuffer.MAGIC
+
+    def write(self, instruction: Instruction) -> None:
+        self._instructions.append(instruction)
+        if len(self._instructions) >= self._buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        # The header is written even if there are no instructions, so an empty class is still a valid file
+        self._file_obj.write(self._header)
+        self._header = b''
+        if len(self._instructions):
+            self._instructions.dump(self._file_obj)
+            self.written += len(self._instructions)
+            self._instructions.clear()
@@ -1,4 +1,11 @@
 from .JackClass import JackClass                                # noqa: F401
+from .JackProgram import JackProgram                            # noqa: F401
 from .JackSubroutine import JackSubroutine                      # noqa: F401
+from .Variable import Variable                                  # noqa: F401
+from .Syntax import SyntaxElement, SyntaxBuilder                # noqa: F401
+from .VmWriter import VmWriter, BinaryVmWriter                  # noqa: F401
+from .Instruction import Instruction, InstructionBuffer, Opcode, Segment, JUMP_OPCODES, \
+    parse_instruction, format_instruction                       # noqa: F401
+from .LabelAllocator import LabelAllocator                      # noqa: F401
 from .Statement import *                                        # noqa: F403, F401
 from .Expression import *                                       # noqa: F403, F401
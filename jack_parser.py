@@ -0,0 +1,506 @@
+from lexer import Lexer, StreamLexer, TokenArray, TokenValueError, TokenTypeError, UndefinedSymbolError
+from typing import IO, ContextManager, List, Optional, TextIO, Union, Sequence, Type
+from contextlib import nullcontext
+from jack_elements import JackClass, JackSubroutine, Statement, LetStatement, \
+                            IfStatement, WhileStatement, DoStatement, ReturnStatement, \
+                            Expression, Term, SubroutineCallTerm, AddExpression, SubstractExpression, \
+                            MultiplyExpression, DivideExpression, AndExpression, OrExpression, \
+                            LessThanExpression, GreaterThanExpression, EqualExpression, \
+                            NegateTerm, NotTerm, IntegerConstant, StringConstant, \
+                            KeywordConstant, VariableTerm, BracketsTerm, Variable, \
+                            SyntaxElement, SyntaxBuilder
+from xml_writer import XmlWriter
+
+
+BINARY_OPERATIONS = {
+    '+': AddExpression,
+    '-': SubstractExpression,
+    '*': MultiplyExpression,
+    '/': DivideExpression,
+    '&': AndExpression,
+    '|': OrExpression,
+    '<': LessThanExpression,
+    '>': GreaterThanExpression,
+    '=': EqualExpression
+}
+
+UNARY_OPERATIONS = {
+    '-': NegateTerm,
+    '~': NotTerm
+}
+
+# Used instead of a syntax element when the concrete syntax isn't retained
+_NO_ELEMENT = nullcontext()
+
+
+class JackParser:
+    """
+    The front-end of the compiler: parses Jack code into a JackClass.
+    The parsed class is used by all the backends (write_vm_code and write_syntax), so a file is only parsed
+    once no matter how many outputs are generated from it.
+
+    If retain_syntax is set, the concrete syntax of the class (all of its grammar elements and tokens) is
+    kept in a SyntaxElement tree as well. If syntax_output is given instead, the concrete syntax is written to
+    it as an XML hierarchy while it's parsed, so it's never kept in memory.
+    """
+    _lexer: Lexer
+    _syntax: Union[SyntaxBuilder, XmlWriter, None]
+    _errors: List[UndefinedSymbolError]
+
+    def __init__(self, content: Union[str, TokenArray, IO], lexer_type: Type[Lexer] = Lexer,
+                 retain_syntax: bool = False, syntax_output: Optional[TextIO] = None):
+        """
+        content is either Jack code, the tokens of Jack code that were already read with Lexer.tokenize, or
+        a file object (or an mmap) of Jack code, which is read in chunks by a StreamLexer while it's parsed
+        """
+        if isinstance(content, TokenArray):
+            self._lexer = content.cursor()
+        elif isinstance(content, str):
+            self._lexer = lexer_type(content)
+        else:
+            self._lexer = StreamLexer(content)
+
+        if syntax_output is not None:
+            self._syntax = XmlWriter(syntax_output)
+        else:
+            self._syntax = SyntaxBuilder() if retain_syntax else None
+        self._errors = []
+
+    @property
+    def syntax(self) -> Optional[SyntaxElement]:
+        """
+        The concrete syntax of the class, if it was retained.
+        Available even if parsing failed, with everything that was parsed until the failure.
+        """
+        if not isinstance(self._syntax, SyntaxBuilder):
+            return None
+
+        return self._syntax.root
+
+    def parse(self, strict: bool = True) -> JackClass:
+        """
+        Parses the whole content as a single class.
+        Unless strict is unset, a class that uses symbols that were never defined can't be compiled and
+        fails parsing, even though its syntax is valid.
+        """
+        parsed_class = self._parse_class()
+        if not self._lexer.finished:
+            next_token = self._lexer.next()
+            raise TokenTypeError('EOF', next_token.value, next_token.position)
+
+        if strict and self._errors:
+            raise self._errors[0]
+
+        parsed_class.syntax = self.syntax
+        return parsed_class
+
+    def _element(self, element_type: str) -> ContextManager:
+        """Returns a context manager that wraps everything parsed inside it with a syntax element"""
+        if self._syntax is None:
+            return _NO_ELEMENT
+
+        return self._syntax.element(element_type)
+
+    def _advance(self) -> str:
+        """Pops the next parsed token, and returns its value"""
+        if self._syntax is None:
+            return self._lexer.advance()
+
+        token_type = self._lexer.peek_type()
+        value = self._lexer.advance()
+        self._syntax.add_token(token_type, value)
+        return value
+
+    def _eat(self, value: Union[str, Sequence]) -> None:
+        """
+        Pops the next parsed token and verify it matches to the given value or value sequence.
+        """
+        token_value = self._lexer.peek_value()
+        if isinstance(value, str) and token_value != value:
+            raise TokenValueError(value, token_value, self._lexer.peek().position)
+
+        elif (token_value not in value):
+            # Value is a Sequence
+            raise TokenValueError(' | '.join(value), token_value, self._lexer.peek().position)
+
+        self._advance()
+
+    def _read_identifier(self) -> str:
+        """Read an identifier as the next token"""
+        if self._lexer.peek_type() != 'identifier':
+            token = self._lexer.peek()
+            raise TokenTypeError('identifier', token.value, token.position)
+
+        return self._advance()
+
+    def _is_type(self, token_type: str, token_value: str) -> bool:
+        if token_type == 'identifier':
+            return True
+        elif token_type == 'keyword' and token_value in ('int', 'char', 'boolean'):
+            return True
+        else:
+            return False
+
+    def _read_type(self) -> str:
+        """Read a type as the next token"""
+        if not self._is_type(self._lexer.peek_type(), self._lexer.peek_value()):
+            # Token is not a valid type
+            token = self._lexer.peek()
+            raise TokenTypeError('type', token.value, token.position)
+
+        return self._advance()
+
+    def _read_subroutine_return_type(self) -> str:
+        if self._lexer.peek_value() == 'void':
+            return self._advance()
+        else:
+            return self._read_type()
+
+    def _parse_subroutine_call_term(self, subroutine: JackSubroutine) -> SubroutineCallTerm:
+        # Grammar for subroutineCall:
+        #   subroutineName '(' expressionList ')' |
+        #   (className | varName) '.' subroutineName '(' expressionList ')'
+        # Where expressionList grammar is defined as this:
+        #   (expression (',' expression)*)?
+        first_identifier = self._read_identifier()
+        if self._lexer.peek_value() == '.':
+            self._eat('.')
+            this = subroutine.get(first_identifier)
+            if this is not None:
+                # User asked to call a method of a given variable
+                class_name = this.type
+
+            else:
+                # User asked to call a function or a constructor
+                class_name = first_identifier
+
+            subroutine_name = self._read_identifier()
+
+        else:
+            # User asked to call a method of this.
+            this = subroutine['this']
+            class_name = this.type
+            subroutine_name = first_identifier
+
+        expressions: list[Expression]
+        if this is None:
+            expressions = []
+        else:
+            expressions = [VariableTerm(this)]
+
+        self._eat('(')
+
+        with self._element('expressionList'):
+            if self._lexer.peek_value() != ')':
+                expressions.append(self._parse_expression(subroutine))
+                while self._lexer.peek_value() != ')':
+                    self._eat(',')
+                    expressions.append(self._parse_expression(subroutine))
+
+        self._eat(')')
+
+        return SubroutineCallTerm(f'{class_name}.{subroutine_name}', expressions)
+
+    def _parse_constant_term(self, subroutine: JackSubroutine) -> Term:
+        term_type = self._lexer.peek_type()
+        if term_type == 'integerConstant':
+            return IntegerConstant(int(self._advance()))
+        elif term_type == 'stringConstant':
+            return StringConstant(self._advance())
+
+        assert(term_type == 'keyword')
+        if self._lexer.peek_value() not in ('true', 'false', 'null', 'this'):
+            term_token = self._lexer.peek()
+            raise TokenTypeError('term', term_token.value, term_token.position)
+
+        term_value = self._advance()
+        if term_value == 'this':
+            return VariableTerm(subroutine['this'])
+
+        return KeywordConstant(term_value)
+
+    def _parse_variable_term(self, subroutine: JackSubroutine) -> VariableTerm:
+        name_token = self._lexer.peek()
+        name = self._read_identifier()
+        variable = subroutine.get(name)
+        if variable is None:
+            # Keep parsing, so the syntax of the whole class is still available
+            self._errors.append(UndefinedSymbolError(name, name_token.position))
+            variable = Variable(name, '', 0)
+
+        if self._lexer.peek_value() == '[':
+            self._eat('[')
+            offset = self._parse_expression(subroutine)
+            self._eat(']')
+        else:
+            offset = None
+
+        return VariableTerm(variable, offset)
+
+    def _parse_term(self, subroutine: JackSubroutine) -> Term:
+        # Grammar for term:
+        #   integerConstant|stringConstant|keywordConstant|varName|varName '[' expression ']'|
+        #   subroutineCall|'(' expression ')'|unaryOp term
+        with self._element('term'):
+            term_type = self._lexer.peek_type()
+            term_value = self._lexer.peek_value()
+            if term_type in ('integerConstant', 'stringConstant', 'keyword'):
+                return self._parse_constant_term(subroutine)
+
+            elif term_type == 'identifier':
+                # Can be one of the following:
+                #   varName
+                #   varName '[' expression ']'
+                #   subroutineCall, which can be:
+                #       subroutineName '(' expressionList ')'
+                #       (className|varName) '.' subroutineName '(' expressionList ')'
+                if self._lexer.peek_value(2) in ('(', '.'):
+                    return self._parse_subroutine_call_term(subroutine)
+                else:
+                    return self._parse_variable_term(subroutine)
+
+            elif term_value in UNARY_OPERATIONS:
+                operation = UNARY_OPERATIONS[self._advance()]
+                inner = self._parse_term(subroutine)
+                return operation(inner)
+
+            elif term_value == '(':
+                self._eat('(')
+                expression = self._parse_expression(subroutine)
+                self._eat(')')
+
+                return BracketsTerm(expression)
+
+            else:
+                raise TokenTypeError('term', term_value, self._lexer.peek().position)
+
+    def _parse_expression(self, subroutine: JackSubroutine) -> Expression:
+        with self._element('expression'):
+            current_expression = self._parse_term(subroutine)
+            while self._lexer.peek_value() in BINARY_OPERATIONS:
+                operation_type = BINARY_OPERATIONS[self._advance()]
+                next_term = self._parse_term(subroutine)
+                current_expression = operation_type(current_expression, next_term)
+
+        return current_expression
+
+    def _parse_let_statement(self, subroutine: JackSubroutine) -> LetStatement:
+        # Grammar for a letStatement:
+        #   'let' varName ('[' expression ']')? '=' expression ';'
+        self._eat('let')
+
+        variable_term = self._parse_variable_term(subroutine)
+
+        self._eat('=')
+        value = self._parse_expression(subroutine)
+        self._eat(';')
+
+        return LetStatement(variable_term, value)
+
+    def _parse_if_statement(self, subroutine: JackSubroutine) -> IfStatement:
+        # Grammar for an ifStatement:
+        #   'if '(' expression ')' '{' statements '}' ('else' '{' statements '}')?
+        token = self._lexer.peek()
+        self._eat('if')
+        self._eat('(')
+
+        condition = self._parse_expression(subroutine)
+        # TODO: Verify that condition is boolean
+
+        self._eat(')')
+        self._eat('{')
+        true_statements = self._parse_statements(subroutine)
+        self._eat('}')
+
+        if self._lexer.peek_value() == 'else':
+            # Handle else case
+            self._eat('else')
+            self._eat('{')
+            false_statements = self._parse_statements(subroutine)
+            self._eat('}')
+
+        else:
+            false_statements = None
+
+        return IfStatement(condition, true_statements, false_statements, token)
+
+    def _parse_while_statement(self, subroutine: JackSubroutine) -> WhileStatement:
+        # Grammar for a whileStatement:
+        #   'while' '(' expression ')' '{' statements '}'
+        token = self._lexer.peek()
+        self._eat('while')
+        self._eat('(')
+        condition = self._parse_expression(subroutine)
+        self._eat(')')
+        self._eat('{')
+        statements = self._parse_statements(subroutine)
+        self._eat('}')
+
+        return WhileStatement(condition, statements, token)
+
+    def _parse_do_statement(self, subroutine: JackSubroutine) -> DoStatement:
+        # Grammar for a doStatement:
+        #   'do' subroutineCall ';'
+        self._eat('do')
+        call_term = self._parse_subroutine_call_term(subroutine)
+        self._eat(';')
+
+        return DoStatement(call_term)
+
+    def _parse_return_statement(self, subroutine: JackSubroutine) -> ReturnStatement:
+        # Grammar for a returnStatement:
+        #   'return' expression? ';'
+        self._eat('return')
+        if self._lexer.peek_value() != ';':
+            expression = self._parse_expression(subroutine)
+
+        else:
+            expression = None
+
+        # TODO: Verify that the expression type matches the given expression
+
+        self._eat(';')
+
+        return ReturnStatement(expression)
+
+    def _parse_statement(self, subroutine: JackSubroutine) -> Statement:
+        statement_value = self._lexer.peek_value()
+        if statement_value == 'let':
+            with self._element('letStatement'):
+                return self._parse_let_statement(subroutine)
+
+        elif statement_value == 'if':
+            with self._element('ifStatement'):
+                return self._parse_if_statement(subroutine)
+
+        elif statement_value == 'while':
+            with self._element('whileStatement'):
+                return self._parse_while_statement(subroutine)
+
+        elif statement_value == 'do':
+            with self._element('doStatement'):
+                return self._parse_do_statement(subroutine)
+
+        elif statement_value == 'return':
+            with self._element('returnStatement'):
+                return self._parse_return_statement(subroutine)
+
+        else:
+            # Parsed token is not a valid statement
+            raise TokenTypeError('statement', statement_value, self._lexer.peek().position)
+
+    def _parse_statements(self, subroutine: JackSubroutine) -> Sequence[Statement]:
+        output = []
+        with self._element('statements'):
+            while self._lexer.peek_value() in ('let', 'if', 'while', 'do', 'return'):
+                output.append(self._parse_statement(subroutine))
+
+        return output
+
+    def _parse_variable_declaration(self, subroutine: JackSubroutine) -> None:
+        # Grammar for varDec:
+        #   'var' type varName (',' varName)* ';'
+        self._eat('var')
+
+        variable_type = self._read_type()
+        variable_name = self._read_identifier()
+        subroutine.add_local(variable_name, variable_type)
+
+        while self._lexer.peek_value() == ',':
+            self._eat(',')
+            variable_name = self._read_identifier()
+            subroutine.add_local(variable_name, variable_type)
+
+        self._eat(';')
+
+    def _parse_subroutine_body(self, subroutine) -> None:
+        # Grammar for subroutineBody:
+        #   '{' varDec* statements '}'
+        self._eat('{')
+        while self._lexer.peek_value() == 'var':
+            with self._element('varDec'):
+                self._parse_variable_declaration(subroutine)
+
+        subroutine.add_statements(self._parse_statements(subroutine))
+        self._eat('}')
+
+    def _add_argument(self, subroutine: JackSubroutine) -> None:
+        argument_type = self._read_type()
+        argument_name = self._read_identifier()
+        subroutine.add_argument(argument_name, argument_type)
+
+    def _parse_subroutine(self, jack_class: JackClass) -> None:
+        # Grammar for a subroutineDec is:
+        #   ('constructor'|'function'|'method') ('void'|type) subroutineName '('
+        #   parameterList ')' subroutineBody
+        # Where subroutineName is an identifier
+
+        # Create the subroutine
+        subroutine_kind = self._advance()
+        subroutine_return_type = self._read_subroutine_return_type()
+        subroutine_name = self._read_identifier()
+        subroutine = jack_class.create_subroutine(subroutine_kind, subroutine_name, subroutine_return_type)
+
+        # Add all arguments
+        self._eat('(')
+
+        # Grammar for a parameterList is:
+        #   (type varName (',' type varName)*)?
+        # Where varName is an identifier
+        with self._element('parameterList'):
+            if ')' != self._lexer.peek_value():
+                self._add_argument(subroutine)
+                while self._lexer.peek_value() == ',':
+                    self._eat(',')
+                    self._add_argument(subroutine)
+
+        self._eat(')')
+
+        # Parse its body
+        with self._element('subroutineBody'):
+            self._parse_subroutine_body(subroutine)
+
+    def _parse_class_subroutines(self, jack_class: JackClass) -> None:
+        while self._lexer.peek_value() in ('constructor', 'function', 'method'):
+            with self._element('subroutineDec'):
+                self._parse_subroutine(jack_class)
+
+    def _parse_class_variable(self, jack_class: JackClass) -> None:
+        # Grammar for a classVarDec is:
+        #   ('static'|'field') type varName (',' varName)* ';'
+        # Where varName is an identifier
+        variable_kind = self._advance()
+        variable_type = self._read_type()
+        variable_name = self._read_identifier()
+
+        jack_class.add_variable(variable_kind, variable_name, variable_type)
+
+        while self._lexer.peek_value() == ',':
+            self._eat(',')
+            variable_name = self._read_identifier()
+            jack_class.add_variable(variable_kind, variable_name, variable_type)
+
+        self._eat(';')
+
+    def _parse_class_variables(self, jack_class: JackClass) -> None:
+        """Parse all class variables"""
+        while self._lexer.peek_value() in ('field', 'static'):
+            with self._element('classVarDec'):
+                self._parse_class_variable(jack_class)
+
+    def _parse_class(self) -> JackClass:
+        """Parses a class"""
+        with self._element('class'):
+            # Define a jack class
+            self._eat('class')
+            class_name = self._read_identifier()
+            jack_class = JackClass(class_name)
+
+            self._eat('{')
+
+            self._parse_class_variables(jack_class)
+            self._parse_class_subroutines(jack_class)
+
+            self._eat('}')
+
+        return jack_class
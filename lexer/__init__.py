@@ -1,3 +1,12 @@
 from .lexer import Lexer, TokenParseError, TokenValueError, \
-                   TokenTypeError                                # noqa: F401
+                   TokenTypeError, UndefinedSymbolError          # noqa: F401
+from .regex_lexer import RegexLexer                              # noqa: F401
+from .stream_lexer import StreamLexer                            # noqa: F401
 from .token import Token                                         # noqa: F401
+from .token_array import TokenArray, TokenCursor                 # noqa: F401
+
+# All available lexer backends, by the name they can be selected with
+LEXERS = {
+    'cursor': Lexer,
+    'regex': RegexLexer
+}
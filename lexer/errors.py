@@ -0,0 +1,36 @@
+from typing import Mapping
+
+
+class TokenParseError(Exception):
+    def __init__(self, description: str, line: int, column: int):
+        super().__init__(f'Parse error at line {line}, column {column}: {description}')
+
+
+class EndOfFileError(TokenParseError):
+    def __init__(self, position: Mapping[str, int]):
+        super().__init__("End Of File reached", position['line'], position['column'])
+
+
+class UnterminatedStringError(TokenParseError):
+    def __init__(self, position: Mapping[str, int]):
+        super().__init__('Unterminated string', position['last_line'], position['last_column'])
+
+
+class TokenTypeError(TokenParseError):
+    def __init__(self, expected: str, got: str, position: Mapping[str, int]):
+        super().__init__(f"Expected {expected} and got \"{got}\"", position['line'], position['column'])
+
+
+class TokenValueError(TokenParseError):
+    def __init__(self, expected: str, got: str, position: Mapping[str, int]):
+        super().__init__(f"Expected \"{expected}\" and got \"{got}\"", position['last_line'], position['last_column'])
+
+
+class UnexpectedCharacterError(TokenParseError):
+    def __init__(self, char: str, position: Mapping[str, int]):
+        super().__init__(f"Unxpected character: {repr(char)}", position['line'], position['column'])
+
+
+class UndefinedSymbolError(TokenParseError):
+    def __init__(self, name: str, position: Mapping[str, int]):
+        super().__init__(f"\"{name}\" was not defined", position['line'], position['column'])
@@ -1,220 +1,204 @@
 from .token import Token
-from typing import Sequence, Mapping
+from .source import Source
+from .token_array import TokenArray
+from .errors import TokenParseError, EndOfFileError, UnterminatedStringError, TokenTypeError, \
+                    TokenValueError, UnexpectedCharacterError, UndefinedSymbolError  # noqa: F401
+from typing import Deque, Mapping
+from collections import deque
 import string
 
 SYMBOLS = {'{', '}', '(', ')', '[', ']', '.', ',', ';', '+', '-', '*', '/', '&', '|', '<', '>', '=', '~'}
 KEYWORDS = {'class', 'constructor', 'function', 'method', 'field', 'static', 'var', 'int', 'char',
             'boolean', 'void', 'true', 'false', 'null', 'this', 'let', 'do', 'if', 'else', 'while', 'return'}
 WHITESPACES_CHARS = (' ', '\t', '\n')
-IDENTIFIER_ALLOWED_CHARS = string.ascii_letters + '_' + string.digits
+IDENTIFIER_START_CHARS = string.ascii_letters + '_'
+IDENTIFIER_ALLOWED_CHARS = IDENTIFIER_START_CHARS + string.digits
 
 
 class Lexer:
+    """
+    Splits Jack source code into tokens.
+
+    The source is kept as a single immutable string, and the lexer only moves a cursor (an offset into that
+    string) forward, so lexing a file is linear in its size. Line and column positions are only computed
+    from offsets when they are needed.
+    """
     _content: str
-    _computed: Sequence
-    _position: Mapping[str, int]
+    _source: Source
+    _base: int
+    _length: int
+    _offset: int
+    _last_offset: int
+    _lookahead: Deque[Token]
 
     def __init__(self, content: str):
         self._content = content
-        self._computed = []
-        self._position = {
-            'last_line': 0,
-            'last_column': 0,
-            'line': 0,
-            'column': 0
-        }
-
-    def _get_next_raw_char(self, peek: bool = False) -> str:
-        """Returns the next unparsed char without skipping comments"""
-        # Check if we read beyond the file limits
-        if not self._content:
-            raise EndOfFileError(self.position)
-
-        # Read next character
-        result = self._content[0]
-        if not peek:
-            self._content = self._content[1:]
-
-        # Update self._position
-        if result == '\n':
-            self._position['line'] += 1
-            self._position['column'] = 0
-        else:
-            self._position['column'] += 1
-
-        # Return read char
-        return result
-
-    def _skip_whitespaces(self) -> None:
-        """Pops from queue all whitespaces characters"""
-        while self._content and self._get_next_raw_char(peek=True) in WHITESPACES_CHARS:
-            self._get_next_raw_char()
-
-    def _skip_comments(self, whitespaces: bool = False):
-        """Skip comments if there are any before the next parsed token"""
-        # Skip whitespaces if needed
-        if whitespaces:
-            self._skip_whitespaces()
-
-        while self._content.startswith('//') or self._content.startswith('/*'):
-            if self._content.startswith('//'):
-                # Next char starts a line comment
-                next_character = self._get_next_raw_char()
-                while next_character != '\n':
-                    next_character = self._get_next_raw_char()
+        self._source = Source(content)
+        # The offset in the source that the content starts at, only lexers that read the source in windows
+        # move it (see StreamLexer). The other offsets are offsets into the content.
+        self._base = 0
+        self._length = len(content)
+        self._offset = 0
+        self._last_offset = 0
+        self._lookahead = deque()
+
+    def _scan(self, offset: int, allowed_chars: str) -> int:
+        """Returns the offset of the first character from the given offset that isn't in allowed_chars"""
+        content, length = self._content, self._length
+        while offset < length and content[offset] in allowed_chars:
+            offset += 1
+
+        return offset
+
+    def _skip(self) -> None:
+        """Moves the cursor over all whitespaces and comments before the next token"""
+        content, length = self._content, self._length
+        offset = self._offset
+        while offset < length:
+            if content[offset] in WHITESPACES_CHARS:
+                offset += 1
+
+            elif content.startswith('//', offset):
+                # A line comment, ends at the end of the line (the new line itself is a whitespace)
+                offset = content.find('\n', offset)
+                if offset == -1:
+                    offset = length
+
+            elif content.startswith('/*', offset):
+                # A multiline comment
+                end = content.find('*/', offset + 2)
+                if end == -1:
+                    self._offset = length
+                    raise EndOfFileError(self.position)
+
+                offset = end + 2
 
             else:
-                # Next char starts a multiline comment
-                next_character = self._get_next_raw_char()
-                while not (next_character == '*' and self._get_next_raw_char(peek=True) == '/'):
-                    next_character = self._get_next_raw_char()
-
-                # Next character is '/' (after we poped '*'), pop it
-                self._get_next_raw_char()
-
-            # Skip whitespaces if needed
-            if whitespaces:
-                self._skip_whitespaces()
-
-    def _skip(self, comments: bool = False, whitespaces: bool = False) -> None:
-        if comments:
-            self._skip_comments(whitespaces=whitespaces)
-        elif whitespaces:
-            self._skip_whitespaces()
-
-    def _get_next_char(self, peek: bool = False) -> str:
-        """Returns the next unparsed char while skipping comments"""
-        # Make sure that next char doesn't begin a new comment
-        self._skip(comments=True)
-
-        # Backup position if peek was asked
-        backup_position = self.position
-
-        # Read next char
-        result = self._get_next_raw_char()
-
-        # We can't modify self._content if the caller asked for peek, restore it to its original state
-        if peek:
-            # Push back the character
-            self._position = backup_position
-            self._content = result + self._content
-
-        return result
-
-    def _get_next_sequence(self, allowed_chars: str) -> str:
-        """Return the next maximum valid sequence that contains only allowed_chars"""
-        result = ''
-        # Check that there is a next_char, and that the next char is in allowed_chars
-        while self._content and self._get_next_char(peek=True) in allowed_chars:
-            result += self._get_next_char()
-        return result
+                break
 
-    def next(self) -> Token:
-        """Return the next maximum valid sequence that can be parsed as a token"""
-        if self._computed:
-            return self._computed.pop()
+        self._offset = offset
 
-        # Update last position
-        self._position['last_line'], self._position['last_column'] = self.line, self.column
-
-        # Skip whitespaces and comments to backup a relevant token position
-        self._skip(comments=True, whitespaces=True)
-        token_position = self.position
+    def _read_token(self) -> Token:
+        """Reads the token that starts at the cursor, assuming there are no whitespaces or comments before it"""
+        content, start = self._content, self._offset
+        if start >= self._length:
+            raise EndOfFileError(self.position)
 
         # Determine which token type is being parsed
-        next_char = self._get_next_char()
+        next_char = content[start]
         if next_char in string.digits:
             # Next token is a integerConstant
-            full_expression = next_char + self._get_next_sequence(string.digits)
-            return Token(full_expression, 'integerConstant', token_position)
+            end = self._scan(start + 1, string.digits)
+            token_type = 'integerConstant'
+            value = content[start:end]
 
-        elif next_char in string.ascii_letters or next_char == '_':
+        elif next_char in IDENTIFIER_START_CHARS:
             # Next token is an identifier or a keyword
-            full_expression = next_char + self._get_next_sequence(IDENTIFIER_ALLOWED_CHARS)
-            if full_expression in KEYWORDS:
-                return Token(full_expression, 'keyword', token_position)
-            else:
-                return Token(full_expression, 'identifier', token_position)
+            end = self._scan(start + 1, IDENTIFIER_ALLOWED_CHARS)
+            value = content[start:end]
+            token_type = 'keyword' if value in KEYWORDS else 'identifier'
 
         elif next_char == '"':
-            # Next token is a stringConstant
-            full_expression = ''
-            next_char = self._get_next_raw_char()
-            while next_char != '"':
-                if next_char == '\n':
-                    raise UnterminatedStringError(self.position)
+            # Next token is a stringConstant, which must end before the end of the line
+            end = content.find('"', start + 1)
+            if content.find('\n', start + 1, self._length if end == -1 else end) != -1:
+                raise UnterminatedStringError(self.position)
 
-                full_expression += next_char
-                next_char = self._get_next_raw_char()
+            if end == -1:
+                self._offset = self._length
+                raise EndOfFileError(self.position)
 
-            return Token(full_expression, 'stringConstant', token_position)
+            token_type = 'stringConstant'
+            value = content[start + 1:end]
+            end += 1
 
         elif next_char in SYMBOLS:
             # Next token is a symbol
-            return Token(next_char, 'symbol', token_position)
+            end = start + 1
+            token_type = 'symbol'
+            value = next_char
 
         else:
             # next_char cannot start any valid token
-            raise UnexpectedCharacterError(next_char, token_position)
+            raise UnexpectedCharacterError(next_char, self.position)
+
+        base = self._base
+        token = Token(value, token_type, base + start, base + self._last_offset, self._source)
+        self._offset = self._last_offset = end
+        return token
+
+    def _lex(self) -> Token:
+        """Reads the next token from the source, ignoring the lookahead buffer"""
+        self._skip()
+        return self._read_token()
+
+    def next(self) -> Token:
+        """Return the next maximum valid sequence that can be parsed as a token"""
+        if self._lookahead:
+            return self._lookahead.popleft()
+
+        return self._lex()
 
     def peek(self, count: int = 1) -> Token:
         """Returns the next parsed token without fetching it from the token queue"""
-        return_queue = []
-        for i in range(count):
-            next_token = self.next()
-            return_queue.insert(0, next_token)
+        lookahead = self._lookahead
+        while len(lookahead) < count:
+            lookahead.append(self._lex())
+
+        return lookahead[count - 1]
+
+    def peek_value(self, count: int = 1) -> str:
+        """Returns the value of the next parsed token without fetching it from the token queue"""
+        return self.peek(count).value
 
-        self._computed += return_queue
+    def peek_type(self, count: int = 1) -> str:
+        """Returns the type of the next parsed token without fetching it from the token queue"""
+        return self.peek(count).type
 
-        return next_token
+    def advance(self) -> str:
+        """Fetches the next parsed token from the token queue, and returns its value"""
+        return self.next().value
+
+    def tokenize(self) -> TokenArray:
+        """Reads all the remaining tokens up front, into a TokenArray"""
+        tokens = TokenArray(self._source, self._length)
+        while not self.finished:
+            token = self.next()
+            tokens.append(token.type, token.value, token.offset)
+
+        return tokens
 
     @property
     def position(self) -> Mapping[str, int]:
-        """Returns the current position"""
-        return self._position.copy()
+        """
+        Returns the current position.
+        line and column are the position of the cursor, and last_line and last_column are the position
+        right after the last token that was read.
+        """
+        line, column = self._source.locate(self._base + self._offset)
+        last_line, last_column = self._source.locate(self._base + self._last_offset)
+        return {
+            'last_line': last_line,
+            'last_column': last_column,
+            'line': line,
+            'column': column
+        }
 
     @property
     def line(self) -> int:
         """Return the current line"""
-        return self._position["line"]
+        return self._source.locate(self._base + self._offset)[0]
 
     @property
     def column(self) -> int:
         """Return the current column"""
-        return self._position["column"]
+        return self._source.locate(self._base + self._offset)[1]
 
     @property
     def finished(self) -> bool:
         """Returns whether we finished parsing all code, or there are more tokens to parse."""
-        self._skip(comments=True, whitespaces=True)
-        return self._content == ''
-
-
-class TokenParseError(Exception):
-    def __init__(self, description: str, line: int, column: int):
-        super().__init__(f'Parse error at line {line}, column {column}: {description}')
-
-
-class EndOfFileError(TokenParseError):
-    def __init__(self, position: Mapping[str, int]):
-        super().__init__("End Of File reached", position['line'], position['column'])
-
-
-class UnterminatedStringError(TokenParseError):
-    def __init__(self, position: Mapping[str, int]):
-        super().__init__('Unterminated string', position['last_line'], position['last_column'])
-
-
-class TokenTypeError(TokenParseError):
-    def __init__(self, expected: str, got: str, position: Mapping[str, int]):
-        super().__init__(f"Expected {expected} and got \"{got}\"", position['line'], position['column'])
-
-
-class TokenValueError(TokenParseError):
-    def __init__(self, expected: str, got: str, position: Mapping[str, int]):
-        super().__init__(f"Expected \"{expected}\" and got \"{got}\"", position['last_line'], position['last_column'])
-
+        if self._lookahead:
+            return False
 
-class UnexpectedCharacterError(TokenParseError):
-    def __init__(self, char: str, position: Mapping[str, int]):
-        super().__init__(f"Unxpected character: {repr(char)}", position['line'], position['column'])
+        self._skip()
+        return self._offset >= self._length
@@ -0,0 +1,103 @@
+from .lexer import Lexer, KEYWORDS
+from .errors import EndOfFileError, UnterminatedStringError, UnexpectedCharacterError
+from .token import Token
+from .token_array import TokenArray
+import re
+
+# Everything that may separate two tokens: whitespaces, line comments and multiline comments
+SKIP_PATTERN = re.compile(r'(?:[ \t\n]+|//[^\n]*|/\*.*?\*/)*', re.DOTALL)
+
+# A single pattern that matches a token together with everything that separates it from the next token.
+# The name of the matched group is the type of the token.
+TOKEN_PATTERN = re.compile(r'''
+    (?:
+        (?P<integerConstant>[0-9]+) |
+        (?P<identifier>[A-Za-z_][A-Za-z_0-9]*) |
+        "(?P<stringConstant>[^"\n]*)" |
+        (?P<symbol>[{}()\[\].,;+\-*&|<>=~]|/(?![*/]))
+    )
+    (?:[ \t\n]+|//[^\n]*|/\*.*?\*/)*
+''', re.VERBOSE | re.DOTALL)
+
+
+class RegexLexer(Lexer):
+    """
+    A Lexer that reads every token, and the whitespaces and comments after it, with a single match of
+    a precompiled pattern instead of reading it character by character.
+
+    The cursor always points to the beginning of the next token (or to the end of the content).
+    """
+    def __init__(self, content: str):
+        super().__init__(content)
+
+        # Skip everything before the first token, errors are reported once the token is read
+        self._offset = SKIP_PATTERN.match(content).end()
+
+    def _raise_error(self) -> None:
+        """Raises the error that explains why there is no valid token at the cursor"""
+        if self._offset >= self._length:
+            raise EndOfFileError(self.position)
+
+        next_char = self._content[self._offset]
+        if next_char == '"':
+            # A string that wasn't terminated before the end of the line or the end of the file
+            if self._content.find('\n', self._offset) != -1:
+                raise UnterminatedStringError(self.position)
+
+        elif not self._content.startswith('/*', self._offset):
+            # next_char cannot start any valid token
+            raise UnexpectedCharacterError(next_char, self.position)
+
+        # A string or a multiline comment that is never terminated
+        self._offset = self._length
+        raise EndOfFileError(self.position)
+
+    def _lex(self) -> Token:
+        """Reads the next token from the source, ignoring the lookahead buffer"""
+        offset = self._offset
+        match = TOKEN_PATTERN.match(self._content, offset)
+        if match is None:
+            self._raise_error()
+
+        group = token_type = match.lastgroup
+        value = match.group(group)
+        if token_type == 'identifier' and value in KEYWORDS:
+            token_type = 'keyword'
+
+        token = Token(value, token_type, offset, self._last_offset, self._source)
+        self._last_offset = match.end(group) + (group == 'stringConstant')
+        self._offset = match.end()
+        return token
+
+    def tokenize(self) -> TokenArray:
+        """Reads all the remaining tokens up front, into a TokenArray"""
+        if self._lookahead:
+            return super().tokenize()
+
+        tokens = TokenArray(self._source, self._length)
+        append = tokens.append
+        content, offset, length = self._content, self._offset, self._length
+        match_token = TOKEN_PATTERN.match
+        while offset < length:
+            match = match_token(content, offset)
+            if match is None:
+                self._offset = offset
+                self._last_offset = tokens.ends[-1] if tokens.ends else 0
+                self._raise_error()
+
+            group = token_type = match.lastgroup
+            value = match.group(group)
+            if token_type == 'identifier' and value in KEYWORDS:
+                token_type = 'keyword'
+
+            append(token_type, value, offset)
+            offset = match.end()
+
+        self._offset = offset
+        self._last_offset = tokens.ends[-1] if tokens.ends else 0
+        return tokens
+
+    @property
+    def finished(self) -> bool:
+        """Returns whether we finished parsing all code, or there are more tokens to parse."""
+        return not self._lookahead and self._offset >= self._length
@@ -0,0 +1,61 @@
+from array import array
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+
+class Source:
+    """
+    Jack source code, that translates offsets in it to line and column positions.
+
+    Positions are only needed when reporting errors, so the table of line beginnings is only built the
+    first time a position is asked for.
+    """
+    __slots__ = ('_content', '_line_starts')
+    _content: str
+    _line_starts: Optional[List[int]]
+
+    def __init__(self, content: str):
+        self._content = content
+        self._line_starts = None
+
+    def _build_line_starts(self) -> List[int]:
+        """Returns the offsets of the beginnings of all lines in the content"""
+        line_starts = [0]
+        newline = self._content.find('\n')
+        while newline != -1:
+            line_starts.append(newline + 1)
+            newline = self._content.find('\n', newline + 1)
+
+        return line_starts
+
+    def locate(self, offset: int) -> Tuple[int, int]:
+        """Returns the line and the column of the given offset"""
+        if self._line_starts is None:
+            self._line_starts = self._build_line_starts()
+
+        line = bisect_right(self._line_starts, offset) - 1
+        return line, offset - self._line_starts[line]
+
+
+class StreamSource(Source):
+    """
+    The source of code that is read in chunks, that only keeps the offsets of the beginnings of its lines.
+    The lines are recorded while the chunks are read, so positions can be located after the text is gone.
+    """
+    __slots__ = ('length',)
+    length: int
+
+    def __init__(self):
+        super().__init__('')
+        self._line_starts = array('L', [0])
+        self.length = 0
+
+    def feed(self, text: str) -> None:
+        """Records the lines of the next chunk of the source"""
+        line_starts, offset = self._line_starts, self.length
+        newline = text.find('\n')
+        while newline != -1:
+            line_starts.append(offset + newline + 1)
+            newline = text.find('\n', newline + 1)
+
+        self.length += len(text)
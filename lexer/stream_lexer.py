@@ -0,0 +1,120 @@
+from .lexer import Lexer
+from .source import StreamSource
+from .token_array import TokenArray
+from .errors import EndOfFileError
+from typing import IO, Optional, Union
+import codecs
+import io
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class StreamLexer(Lexer):
+    """
+    A Lexer that reads its source from a file object in chunks, instead of from a string of the whole file.
+    The file may be a text file, or a binary file or an mmap of UTF-8 code, that is decoded a chunk at a time.
+
+    The lexer only keeps a window of the source: the lines from the cursor to the end of the last complete
+    line that was read. No token but a multiline comment spans lines, so every other token that starts in the
+    window also ends in it. Comments that continue beyond the window are skipped a window at a time, so the
+    memory the lexer takes is bounded by the chunk size and the longest line, no matter how long the file is.
+
+    The window is the content of the lexer, and the base of the lexer is the offset in the source that the
+    window starts at, so the offsets of the tokens are still offsets into the whole source.
+    """
+    _file_obj: IO
+    _chunk_size: int
+    _decoder: Optional[io.IncrementalNewlineDecoder]
+    _source: StreamSource
+    _pending: str
+    _end_of_input: bool
+
+    def __init__(self, file_obj: IO, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__('')
+        self._file_obj = file_obj
+        self._chunk_size = chunk_size
+        self._decoder = None
+        self._source = StreamSource()
+        self._pending = ''
+        self._end_of_input = False
+
+    def _read_chunk(self) -> str:
+        """Reads the next chunk of the file as text, returns an empty string at the end of the file"""
+        chunk: Union[str, bytes] = self._file_obj.read(self._chunk_size)
+        if isinstance(chunk, str):
+            return chunk
+
+        if self._decoder is None:
+            # New lines are translated to '\n' like in text files, a '\r\n' may be split between chunks too
+            self._decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+
+        # A character may be split between chunks, the decoder holds its first bytes until the rest arrive
+        text = self._decoder.decode(chunk, final=not chunk)
+        return self._read_chunk() if chunk and not text else text
+
+    def _fill(self) -> bool:
+        """
+        Drops everything before the cursor from the window, and adds the next complete lines of the file to
+        it. Returns whether there were more lines to add.
+        """
+        if self._end_of_input:
+            return False
+
+        text = self._pending
+        while True:
+            chunk = self._read_chunk()
+            if not chunk:
+                self._end_of_input = True
+                self._pending = ''
+                break
+
+            newline = chunk.rfind('\n')
+            if newline != -1:
+                text += chunk[:newline + 1]
+                self._pending = chunk[newline + 1:]
+                break
+
+            text += chunk
+
+        consumed = self._offset
+        self._base += consumed
+        self._content = self._content[consumed:] + text
+        self._length = len(self._content)
+        self._offset -= consumed
+        self._last_offset -= consumed
+        self._source.feed(text)
+        return bool(text)
+
+    def _skip_comment(self) -> None:
+        """Moves the cursor to the end of a multiline comment that didn't end in the window"""
+        while self._fill():
+            # The window always ends with a new line, so the end of the comment is never split between windows
+            end = self._content.find('*/', self._offset)
+            if end != -1:
+                self._offset = end + 2
+                return
+
+            self._offset = self._length
+
+        raise EndOfFileError(self.position)
+
+    def _skip(self) -> None:
+        """Moves the cursor over all whitespaces and comments before the next token, reading more if needed"""
+        while True:
+            try:
+                Lexer._skip(self)
+            except EndOfFileError:
+                # The window was dropped up to its end, the comment is read on without keeping it
+                self._skip_comment()
+                continue
+
+            if self._offset < self._length or not self._fill():
+                return
+
+    def tokenize(self) -> TokenArray:
+        """Reads all the remaining tokens up front, into a TokenArray"""
+        tokens = super().tokenize()
+
+        # The length of the source is only known once it was read to the end
+        tokens.length = self._source.length
+        return tokens
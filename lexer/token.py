@@ -1,20 +1,33 @@
+from typing import Mapping
+
+
 class Token:
-    def __init__(self, value, token_type, position):
-        self._value = value
-        self._type = token_type
-        self._position = position
+    """
+    A token that was read by the lexer.
+    Only the offsets of the token are kept, its position is computed from them when asked for.
+    """
+    __slots__ = ('value', 'type', '_offset', '_last_offset', '_source')
 
-    @property
-    def value(self):
-        """The value of the token"""
-        return self._value
+    def __init__(self, value: str, token_type: str, offset: int, last_offset: int, source):
+        self.value = value
+        self.type = token_type
+        self._offset = offset
+        self._last_offset = last_offset
+        self._source = source
 
     @property
-    def type(self):
-        """The type of the token"""
-        return self._type
+    def offset(self) -> int:
+        """The offset in the source that the token starts at"""
+        return self._offset
 
     @property
-    def position(self):
+    def position(self) -> Mapping[str, int]:
         """The position that the token was defined"""
-        return self._position.copy()
+        line, column = self._source.locate(self._offset)
+        last_line, last_column = self._source.locate(self._last_offset)
+        return {
+            'last_line': last_line,
+            'last_column': last_column,
+            'line': line,
+            'column': column
+        }
@@ -0,0 +1,139 @@
+from .token import Token
+from .source import Source
+from .errors import EndOfFileError
+from array import array
+from typing import Dict, List, Mapping
+import sys
+
+# All token types, the index of a type is the code it is stored with in a TokenArray
+TOKEN_TYPES = ('keyword', 'symbol', 'integerConstant', 'stringConstant', 'identifier')
+TOKEN_TYPE_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+
+
+class TokenArray:
+    """
+    All the tokens of a file, stored in columns instead of as Token objects:
+    an array of type codes, arrays of start and end offsets, and an array of indices into a table of
+    interned values.
+    """
+    __slots__ = ('types', 'starts', 'ends', 'values', 'value_table', 'length', '_value_codes', '_source')
+    types: array
+    starts: array
+    ends: array
+    values: array
+    value_table: List[str]
+    length: int
+    _value_codes: Dict[str, int]
+    _source: Source
+
+    def __init__(self, source: Source, length: int):
+        self.types = array('B')
+        self.starts = array('L')
+        self.ends = array('L')
+        self.values = array('L')
+        self.value_table = []
+        # The length of the source, the end of the file is reported at it once the tokens run out
+        self.length = length
+        self._value_codes = {}
+        self._source = source
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def append(self, token_type: str, value: str, start: int) -> None:
+        """Adds a token to the end of the array"""
+        value_code = self._value_codes.get(value)
+        if value_code is None:
+            if token_type == 'identifier':
+                # Identifiers are the keys of symbol tables, which intern them too, so they're found by identity
+                value = sys.intern(value)
+
+            value_code = self._value_codes[value] = len(self.value_table)
+            self.value_table.append(value)
+
+        # Tokens are exactly their value, except for strings that are also surrounded by quotes
+        end = start + len(value)
+        if token_type == 'stringConstant':
+            end += 2
+
+        self.types.append(TOKEN_TYPE_CODES[token_type])
+        self.starts.append(start)
+        self.ends.append(end)
+        self.values.append(value_code)
+
+    def token(self, index: int) -> Token:
+        """Creates a Token object for the token in the given index"""
+        last_offset = self.ends[index - 1] if index > 0 else 0
+        return Token(self.value_table[self.values[index]], TOKEN_TYPES[self.types[index]],
+                     self.starts[index], last_offset, self._source)
+
+    def end_position(self) -> Mapping[str, int]:
+        """Returns the position of the end of the source"""
+        line, column = self._source.locate(self.length)
+        last_line, last_column = self._source.locate(self.ends[-1] if self.ends else 0)
+        return {
+            'last_line': last_line,
+            'last_column': last_column,
+            'line': line,
+            'column': column
+        }
+
+    def cursor(self) -> 'TokenCursor':
+        """Returns a cursor that walks over the tokens from the beginning"""
+        return TokenCursor(self)
+
+
+class TokenCursor:
+    """
+    Walks over a TokenArray by index, with the same interface a Lexer has.
+    Token objects are only created when next() or peek() are called, the parsers use peek_value(),
+    peek_type() and advance() instead.
+    """
+    _tokens: TokenArray
+    _index: int
+
+    def __init__(self, tokens: TokenArray):
+        self._tokens = tokens
+        self._index = 0
+        self._types = tokens.types
+        self._values = tokens.values
+        self._value_table = tokens.value_table
+
+    def next(self) -> Token:
+        """Return the next token"""
+        token = self.peek()
+        self._index += 1
+        return token
+
+    def peek(self, count: int = 1) -> Token:
+        """Returns the next token without moving the cursor"""
+        index = self._index + count - 1
+        if index >= len(self._tokens):
+            raise EndOfFileError(self._tokens.end_position())
+
+        return self._tokens.token(index)
+
+    def peek_value(self, count: int = 1) -> str:
+        """Returns the value of the next token without moving the cursor"""
+        try:
+            return self._value_table[self._values[self._index + count - 1]]
+        except IndexError:
+            raise EndOfFileError(self._tokens.end_position())
+
+    def peek_type(self, count: int = 1) -> str:
+        """Returns the type of the next token without moving the cursor"""
+        try:
+            return TOKEN_TYPES[self._types[self._index + count - 1]]
+        except IndexError:
+            raise EndOfFileError(self._tokens.end_position())
+
+    def advance(self) -> str:
+        """Moves the cursor over the next token, and returns its value"""
+        value = self.peek_value()
+        self._index += 1
+        return value
+
+    @property
+    def finished(self) -> bool:
+        """Returns whether the cursor passed all the tokens"""
+        return self._index >= len(self._tokens)
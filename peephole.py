@@ -0,0 +1,269 @@
+from jack_elements import VmWriter, Instruction, Opcode, JUMP_OPCODES
+from typing import Callable, Dict, List, Sequence
+
+Pass = Callable[[List[Instruction]], List[Instruction]]
+
+# Enum members are looked up through their class on every access, so the passes use module constants
+_EQ = Opcode.EQ
+_FUNCTION = Opcode.FUNCTION
+_GOTO = Opcode.GOTO
+_GT = Opcode.GT
+_IF_GOTO = Opcode.IF_GOTO
+_LABEL = Opcode.LABEL
+_LT = Opcode.LT
+_NEG = Opcode.NEG
+_NOT = Opcode.NOT
+_POP = Opcode.POP
+_PUSH = Opcode.PUSH
+_RETURN = Opcode.RETURN
+
+# Commands whose result is always true (-1) or false (0). not is bitwise, so it only negates the condition of
+# an if-goto when it's applied to one of them.
+_COMPARISONS = ((_LT,), (_GT,), (_EQ,))
+
+
+def remove_push_pop_pairs(instructions: List[Instruction]) -> List[Instruction]:
+    """Removes pushes that are immediately popped back to the same place, like in let x = x"""
+    output = []
+    for instruction in instructions:
+        if instruction[0] == _POP and output and output[-1] == (_PUSH, instruction[1], instruction[2]):
+            output.pop()
+        else:
+            output.append(instruction)
+
+    return output
+
+
+def remove_double_negations(instructions: List[Instruction]) -> List[Instruction]:
+    """Removes pairs of not or neg commands, that cancel each other"""
+    output = []
+    for instruction in instructions:
+        if instruction in ((_NOT,), (_NEG,)) and output and output[-1] == instruction:
+            output.pop()
+        else:
+            output.append(instruction)
+
+    return output
+
+
+def invert_branches(instructions: List[Instruction]) -> List[Instruction]:
+    """
+    Replaces a negated comparison that jumps over a goto with a comparison that jumps to the goto's label:
+        not / if-goto A / goto B / label A  ->  if-goto B / label A
+    This is the code of an if statement with an empty else, whose condition is a negated comparison.
+    """
+    output = []
+    i = 0
+    while i < len(instructions):
+        window = instructions[i:i + 4]
+        if len(window) == 4 and window[0] == (_NOT,) and output and output[-1] in _COMPARISONS \
+                and window[1][0] == _IF_GOTO and window[2][0] == _GOTO \
+                and window[3] == (_LABEL, window[1][1]):
+            output.append((_IF_GOTO, window[2][1]))
+            i += 3
+        else:
+            output.append(instructions[i])
+            i += 1
+
+    return output
+
+
+def _is_control(instruction: Instruction) -> bool:
+    return instruction[0] in (_LABEL, _GOTO, _IF_GOTO, _RETURN, _FUNCTION)
+
+
+def rotate_loops(instructions: List[Instruction]) -> List[Instruction]:
+    """
+    Moves the condition of while loops to their end, so every iteration runs a single jump:
+        label L / <comparison> / not / if-goto E / <body> / goto L / label E
+    becomes
+        goto L / label L_BODY / <body> / label L / <comparison> / if-goto L_BODY / label E
+    """
+    labels = {instruction[1]: i for i, instruction in enumerate(instructions) if instruction[0] == _LABEL}
+    output = []
+    i = 0
+    while i < len(instructions):
+        instruction = instructions[i]
+        if instruction[0] == _LABEL:
+            # The condition of a while loop is an expression, so it has no jumps
+            condition_end = i + 1
+            while condition_end < len(instructions) and not _is_control(instructions[condition_end]):
+                condition_end += 1
+
+            if condition_end < len(instructions) and instructions[condition_end][0] == _IF_GOTO \
+                    and instructions[condition_end - 1] == (_NOT,) \
+                    and instructions[condition_end - 2] in _COMPARISONS:
+                end = labels.get(instructions[condition_end][1], -1)
+                if end > condition_end and instructions[end - 1] == (_GOTO, instruction[1]):
+                    body_label = f'{instruction[1]}_BODY'
+                    output.append((_GOTO, instruction[1]))
+                    output.append((_LABEL, body_label))
+                    output.extend(instructions[condition_end + 1:end - 1])
+                    output.append(instruction)
+                    output.extend(instructions[i + 1:condition_end - 1])
+                    output.append((_IF_GOTO, body_label))
+                    i = end
+                    continue
+
+        output.append(instruction)
+        i += 1
+
+    return output
+
+
+def thread_jumps(instructions: List[Instruction]) -> List[Instruction]:
+    """
+    Redirects jumps to a label that is followed by a goto to the goto's label, and removes gotos to the
+    command that follows them. Labels at the same place are replaced with the first one of them.
+    """
+    # Every label is mapped to the first label of its group, and the command after the group
+    aliases: Dict[str, str] = {}
+    next_commands: Dict[str, Instruction] = {}
+    group = []
+    for instruction in instructions:
+        if instruction[0] == _LABEL:
+            group.append(instruction[1])
+            continue
+
+        for label in group:
+            aliases[label] = group[0]
+            next_commands[label] = instruction
+
+        group = []
+
+    for label in group:
+        aliases[label] = group[0]
+        next_commands[label] = (_RETURN,)
+
+    def resolve(label: str) -> str:
+        visited = set()
+        while label in next_commands and next_commands[label][0] == _GOTO and label not in visited:
+            visited.add(label)
+            label = next_commands[label][1]
+
+        return aliases.get(label, label)
+
+    output = []
+    for i, instruction in enumerate(instructions):
+        if instruction[0] in JUMP_OPCODES:
+            target = resolve(instruction[1])
+
+            # A goto to the next command, skipping the labels in between
+            following = i + 1
+            while following < len(instructions) and instructions[following][0] == _LABEL:
+                following += 1
+
+            if instruction[0] == _GOTO and any(aliases.get(instructions[j][1]) == target
+                                               for j in range(i + 1, following)):
+                continue
+
+            output.append((instruction[0], target))
+
+        elif instruction[0] == _LABEL and aliases[instruction[1]] != instruction[1]:
+            continue
+
+        else:
+            output.append(instruction)
+
+    return output
+
+
+def remove_unreachable(instructions: List[Instruction]) -> List[Instruction]:
+    """Removes the commands after a goto or a return, that no jump leads to"""
+    output = []
+    reachable = True
+    for instruction in instructions:
+        if instruction[0] in (_LABEL, _FUNCTION):
+            reachable = True
+
+        if reachable:
+            output.append(instruction)
+
+        if instruction[0] in (_GOTO, _RETURN):
+            reachable = False
+
+    return output
+
+
+def remove_dead_labels(instructions: List[Instruction]) -> List[Instruction]:
+    """Removes labels that no jump leads to"""
+    targets = {instruction[1] for instruction in instructions if instruction[0] in JUMP_OPCODES}
+    return [instruction for instruction in instructions
+            if instruction[0] != _LABEL or instruction[1] in targets]
+
+
+DEFAULT_PASSES: Sequence[Pass] = (
+    remove_push_pop_pairs,
+    remove_double_negations,
+    invert_branches,
+    rotate_loops,
+    thread_jumps,
+    remove_unreachable,
+    remove_dead_labels,
+)
+
+
+class PeepholeOptimizer:
+    """
+    Runs a sequence of passes over the VM code of every function, until a round of them no longer shortens it.
+    Every pass gets the instructions of a whole function, since labels are local to their function.
+    The optimizer counts the instructions it got and the instructions it returned.
+    """
+    _passes: Sequence[Pass]
+    input_count: int
+    output_count: int
+
+    # Most passes only remove instructions, but rotate_loops adds a jump and a label to every loop it rotates, so
+    # the rounds aren't guaranteed to stop on their own, only this bound guarantees it
+    MAX_ROUNDS = 8
+
+    def __init__(self, passes: Sequence[Pass] = DEFAULT_PASSES):
+        self._passes = passes
+        self.input_count = 0
+        self.output_count = 0
+
+    def optimize(self, instructions: List[Instruction]) -> List[Instruction]:
+        self.input_count += len(instructions)
+        for _ in range(self.MAX_ROUNDS):
+            optimized = instructions
+            for optimization_pass in self._passes:
+                optimized = optimization_pass(optimized)
+
+            # A round that didn't shorten the code is kept, since rotated loops run faster, but it's the last one
+            shortened = len(optimized) < len(instructions)
+            instructions = optimized
+            if not shortened:
+                break
+
+        self.output_count += len(instructions)
+        return instructions
+
+
+class PeepholeWriter(VmWriter):
+    """
+    A VmWriter that collects the instructions of every function, and writes them to another VmWriter once
+    they are optimized.
+    """
+    _writer: VmWriter
+    _optimizer: PeepholeOptimizer
+    _function: List[Instruction]
+
+    def __init__(self, writer: VmWriter, optimizer: PeepholeOptimizer):
+        self._writer = writer
+        self._optimizer = optimizer
+        self._function = []
+
+    def _write_function(self) -> None:
+        if self._function:
+            self._writer.write_all(self._optimizer.optimize(self._function))
+            self._function = []
+
+    def write(self, instruction: Instruction) -> None:
+        if instruction[0] == _FUNCTION:
+            self._write_function()
+
+        self._function.append(instruction)
+
+    def flush(self) -> None:
+        self._write_function()
+        self._writer.flush()
@@ -0,0 +1,157 @@
+import cProfile
+import json
+import os
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Optional, Sequence, TextIO
+from jack_elements import JackClass
+
+# The phases of compiling a file, in the order they run: reading and decoding the source, splitting it to
+# tokens, parsing them, optimizing the parsed class and generating its VM code, and writing the outputs (the XML,
+# the VM code that wasn't written while it was generated, and the outputs that were copied to or from the cache).
+# Files are only split to tokens up front when they're pretokenized, otherwise the lexer runs while the file is
+# parsed, and its time is a part of the parse phase
+PHASES = ('read', 'lex', 'parse', 'codegen', 'write')
+# The sizes of what the phases produced
+COUNTS = ('tokens', 'nodes', 'instructions')
+
+# How many of the slowest files the table shows, before the totals of all of them
+TABLE_ROWS = 20
+
+# Used instead of a phase timer when the file isn't profiled
+_NO_PHASE = nullcontext()
+
+
+class FileProfile:
+    """
+    The time every phase of compiling a file took, and the sizes of what the phases produced: the tokens that
+    were read, the nodes of the parsed class and the VM instructions that were written. The tokens are only
+    counted when the file is split to tokens up front, and are None otherwise.
+    Phases are timed with the phase function, which doesn't time anything when there's no profile, so the
+    compiler isn't slowed down when it isn't profiled.
+    """
+    __slots__ = ('path', 'cached', 'times', 'tokens', 'nodes', 'instructions')
+    path: str
+    cached: bool
+    times: Dict[str, float]
+    tokens: Optional[int]
+    nodes: int
+    instructions: int
+
+    def __init__(self, path: str):
+        self.path = path
+        self.cached = False
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.tokens = None
+        self.nodes = 0
+        self.instructions = 0
+
+    @property
+    def total_time(self) -> float:
+        return sum(self.times.values())
+
+    def timer(self, phase_name: str) -> '_PhaseTimer':
+        """Returns a context manager that adds the time everything inside it took to the given phase"""
+        return _PhaseTimer(self.times, phase_name)
+
+    def count_nodes(self, parsed_class: JackClass) -> None:
+        """Counts the nodes of a parsed class: the class, its subroutines and their statements and expressions"""
+        self.nodes = 1 + sum(1 + sum(1 for _ in subroutine.walk()) for subroutine in parsed_class.subroutines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'cached': self.cached,
+            **{f'{phase_name}_seconds': self.times[phase_name] for phase_name in PHASES},
+            'total_seconds': self.total_time,
+            **{count: getattr(self, count) for count in COUNTS}
+        }
+
+
+class _PhaseTimer:
+    def __init__(self, times: Dict[str, float], phase_name: str):
+        self._times = times
+        self._phase_name = phase_name
+
+    def __enter__(self) -> '_PhaseTimer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception) -> bool:
+        self._times[self._phase_name] += time.perf_counter() - self._start
+        return False
+
+
+def phase(profile: Optional[FileProfile], phase_name: str) -> ContextManager:
+    """Returns a context manager that times a phase of compiling a file, if the file is profiled"""
+    if profile is None:
+        return _NO_PHASE
+
+    return profile.timer(phase_name)
+
+
+def run_profiled(function: Callable[[], Any], dump_directory: str, input_path: str) -> Any:
+    """
+    Runs a function under cProfile, and dumps its stats to a file in dump_directory that is named after the
+    path of the compiled file, so they can be read with pstats.
+    """
+    os.makedirs(dump_directory, exist_ok=True)
+    dump_name = os.path.abspath(input_path).strip(os.sep).replace(os.sep, '.') + '.prof'
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function)
+    finally:
+        profiler.dump_stats(os.path.join(dump_directory, dump_name))
+
+
+def total_profile(profiles: Sequence[FileProfile]) -> FileProfile:
+    """Sums the profiles of all the compiled files"""
+    total = FileProfile('total')
+    for profile in profiles:
+        for phase_name in PHASES:
+            total.times[phase_name] += profile.times[phase_name]
+        for count in COUNTS:
+            value = getattr(profile, count)
+            if value is not None:
+                setattr(total, count, (getattr(total, count) or 0) + value)
+
+    return total
+
+
+def _format_count(value: Optional[int]) -> str:
+    return '-' if value is None else str(value)
+
+
+def write_table(profiles: Sequence[FileProfile], output: TextIO) -> None:
+    """Writes a table of the slowest files, and the totals of all the files"""
+    def write_row(name: str, profile: FileProfile) -> None:
+        times = ''.join(f'{profile.times[phase_name] * 1000:>11.2f}' for phase_name in PHASES)
+        counts = ''.join(f'{_format_count(getattr(profile, count)):>13}' for count in COUNTS)
+        output.write(f'{name:<40}{times}{profile.total_time * 1000:>11.2f}{counts}\n')
+
+    header = ''.join(f'{phase_name + " ms":>11}' for phase_name in PHASES + ('total',))
+    output.write(f'{"file":<40}{header}{"".join(f"{count:>13}" for count in COUNTS)}\n')
+    slowest = sorted(profiles, key=lambda profile: profile.total_time, reverse=True)[:TABLE_ROWS]
+    for profile in slowest:
+        # Long paths are cut from the beginning, the name of the file is the interesting part
+        name = profile.path + (' (cached)' if profile.cached else '')
+        write_row(name if len(name) < 40 else '...' + name[-36:], profile)
+
+    if len(profiles) > len(slowest):
+        output.write(f'... {len(profiles) - len(slowest)} more files\n')
+
+    write_row(f'total ({len(profiles)} files)', total_profile(profiles))
+
+
+def write_json(profiles: Sequence[FileProfile], output: TextIO) -> None:
+    """Writes the profiles of all the files, and their totals, as a JSON document"""
+    total = total_profile(profiles).to_dict()
+    del total['path'], total['cached']
+    json.dump({'files': [profile.to_dict() for profile in profiles], 'total': total}, output, indent=2)
+    output.write('\n')
+
+
+PROFILE_WRITERS = {
+    'table': write_table,
+    'json': write_json
+}
@@ -0,0 +1,46 @@
+"""
+Checks that --reduce-strength only expands the multiplications by constants that are cheaper than a call.
+
+Usage:
+    python3 -m unittest discover tests
+"""
+import io
+import os
+import sys
+import unittest
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jack_parser import JackParser                              # noqa: E402
+from jack_elements import VmWriter                              # noqa: E402
+
+
+def compile_multiplication(factor: int, reduce_strength: bool) -> List[str]:
+    """Compiles a function that multiplies its argument by the factor, and returns its VM commands"""
+    parsed_class = JackParser(f'class Main {{ function int main(int x) {{ return x * {factor}; }} }}').parse()
+    parsed_class.optimize(reduce_strength)
+    output = io.StringIO()
+    writer = VmWriter(output)
+    parsed_class.write_vm_code(writer)
+    writer.flush()
+    return output.getvalue().splitlines()
+
+
+class ReduceStrengthTest(unittest.TestCase):
+    def test_short_chain_is_expanded(self):
+        # 5 is 101 in binary: two doublings and an addition of the operand
+        commands = compile_multiplication(5, reduce_strength=True)
+        self.assertNotIn('call Math.multiply 2', commands)
+        self.assertEqual(commands.count('add'), 3)
+
+    def test_long_chain_is_not_expanded(self):
+        # 25 is 11001 in binary: four doublings and two additions, more than a call to Math.multiply runs
+        commands = compile_multiplication(25, reduce_strength=True)
+        self.assertIn('call Math.multiply 2', commands)
+        self.assertEqual(len(commands), len(compile_multiplication(25, reduce_strength=False)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,617 @@
+import os
+import sys
+import argparse
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from jack_elements import Instruction, InstructionBuffer, Opcode, Segment, parse_instruction
+from jack_elements.Expression import to_word
+
+# Addresses of the Hack RAM
+SP, LCL, ARG, THIS, THAT = range(5)
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+HEAP_BASE = 2048
+HEAP_END = 16384
+RAM_SIZE = 32768
+
+# The decoded operations, every instruction is decoded into an operation and two resolved operands
+(PUSH_CONSTANT, PUSH_SEGMENT, PUSH_ADDRESS, POP_SEGMENT, POP_ADDRESS, ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ GOTO, IF_GOTO, CALL, CALL_OS, CALL_UNDEFINED, FUNCTION, RETURN, HALT) = range(22)
+
+_ARITHMETIC_OPERATIONS = {
+    Opcode.ADD: ADD, Opcode.SUB: SUB, Opcode.NEG: NEG, Opcode.EQ: EQ, Opcode.GT: GT, Opcode.LT: LT,
+    Opcode.AND: AND, Opcode.OR: OR, Opcode.NOT: NOT
+}
+
+# The registers that point to the segments that are indexed indirectly
+_SEGMENT_REGISTERS = {Segment.LOCAL: LCL, Segment.ARGUMENT: ARG, Segment.THIS: THIS, Segment.THAT: THAT}
+
+# The estimated Hack CPU cycles of every operation, as a straightforward VM translator implements it.
+# OS subroutines are stubs, so calling one of them only costs the call and the return.
+CYCLES = {
+    PUSH_CONSTANT: 7, PUSH_SEGMENT: 11, PUSH_ADDRESS: 7, POP_SEGMENT: 13, POP_ADDRESS: 5,
+    ADD: 5, SUB: 5, AND: 5, OR: 5, NEG: 3, NOT: 3, EQ: 14, GT: 14, LT: 14,
+    GOTO: 2, IF_GOTO: 5, CALL: 46, CALL_OS: 46 + 47, CALL_UNDEFINED: 0, FUNCTION: 2, RETURN: 47, HALT: 0
+}
+# Every local variable a function starts with is pushed separately
+CYCLES_PER_LOCAL = 7
+
+Program = List[Tuple[str, Instruction]]
+
+
+class VmError(Exception):
+    """An error while running VM code, like calling an undefined function or running out of input"""
+    pass
+
+
+class Halt(Exception):
+    """Raised by Sys.halt to stop the program"""
+    pass
+
+
+def read_vm_file(path: str) -> Iterator[Instruction]:
+    """Reads the instructions of a text .vm file or a binary .vmb file"""
+    if path.endswith('.vmb'):
+        with open(path, 'rb') as vm_obj:
+            yield from InstructionBuffer.load(vm_obj)
+        return
+
+    with open(path, 'r') as vm_obj:
+        for line in vm_obj:
+            command = line.split('//')[0].strip()
+            if command:
+                yield parse_instruction(command)
+
+
+def load_program(path: str) -> Program:
+    """
+    Reads all the VM files of a program: a single file, or all the .vm (or else .vmb) files of a directory.
+    Returns the instructions with the name of the class they belong to, which their static segment is of.
+    """
+    if os.path.isdir(path):
+        filenames = sorted(os.listdir(path))
+        paths = [os.path.join(path, filename) for filename in filenames if filename.endswith('.vm')] or \
+                [os.path.join(path, filename) for filename in filenames if filename.endswith('.vmb')]
+    else:
+        paths = [path]
+
+    return [(os.path.splitext(os.path.basename(vm_path))[0], instruction)
+            for vm_path in paths for instruction in read_vm_file(vm_path)]
+
+
+class OperatingSystem:
+    """
+    Stubs of the Jack OS classes, that run in Python instead of as VM code.
+    Strings, arrays and objects live in the emulated heap just like with the real OS, so the compiled code can
+    use them directly. The screen is ignored, printed text is collected in output, and the keyboard reads the
+    given input lines.
+    """
+    _ram: List[int]
+    _input: Iterator[str]
+    _typed: str
+    _free: Dict[int, int]
+    _sizes: Dict[int, int]
+    _next: int
+    output: List[str]
+
+    def __init__(self, ram: List[int], input_lines: Iterable[str] = ()):
+        self._ram = ram
+        self._input = iter(input_lines)
+        self._typed = ''
+        self._free = {}
+        self._next = HEAP_BASE
+        self._sizes = {}
+        self.output = []
+
+    def subroutines(self) -> Dict[str, Tuple[Callable[..., Optional[int]], int]]:
+        """The stubbed subroutines by their full name, with their arguments count"""
+        return {
+            'Math.multiply': (lambda x, y: to_word(x * y), 2),
+            'Math.divide': (self._divide, 2),
+            'Math.min': (min, 2),
+            'Math.max': (max, 2),
+            'Math.abs': (lambda x: to_word(abs(x)), 1),
+            'Math.sqrt': (self._sqrt, 1),
+            'Memory.alloc': (self.alloc, 1),
+            'Memory.deAlloc': (self.dealloc, 1),
+            'Memory.peek': (lambda address: self._ram[address], 1),
+            'Memory.poke': (self._poke, 2),
+            'Array.new': (self.alloc, 1),
+            'Array.dispose': (self.dealloc, 1),
+            'String.new': (self._string_new, 1),
+            'String.dispose': (self.dealloc, 1),
+            'String.length': (lambda string: self._ram[string + 1], 1),
+            'String.charAt': (lambda string, index: self._ram[string + 2 + index], 2),
+            'String.setCharAt': (self._string_set_char_at, 3),
+            'String.appendChar': (self._string_append_char, 2),
+            'String.eraseLastChar': (self._string_erase_last_char, 1),
+            'String.intValue': (self._string_int_value, 1),
+            'String.setInt': (self._string_set_int, 2),
+            'String.newLine': (lambda: 128, 0),
+            'String.backSpace': (lambda: 129, 0),
+            'String.doubleQuote': (lambda: 34, 0),
+            'Output.printString': (lambda string: self.output.append(self.string_value(string)), 1),
+            'Output.printInt': (lambda value: self.output.append(str(value)), 1),
+            'Output.printChar': (lambda char: self.output.append(chr(char)), 1),
+            'Output.println': (lambda: self.output.append('\n'), 0),
+            'Output.backSpace': (lambda: None, 0),
+            'Output.moveCursor': (lambda line, column: None, 2),
+            'Screen.clearScreen': (lambda: None, 0),
+            'Screen.setColor': (lambda color: None, 1),
+            'Screen.drawPixel': (lambda x, y: None, 2),
+            'Screen.drawLine': (lambda x1, y1, x2, y2: None, 4),
+            'Screen.drawRectangle': (lambda x1, y1, x2, y2: None, 4),
+            'Screen.drawCircle': (lambda x, y, r: None, 3),
+            'Keyboard.keyPressed': (lambda: 0, 0),
+            'Keyboard.readChar': (self._read_char, 0),
+            'Keyboard.readLine': (lambda message: self._string_from(self._read_line(message)), 1),
+            'Keyboard.readInt': (lambda message: self._parse_int(self._read_line(message)), 1),
+            'Sys.halt': (self._halt, 0),
+            'Sys.error': (self._error, 1),
+            'Sys.wait': (lambda duration: None, 1),
+        }
+
+    def alloc(self, size: int) -> int:
+        """Allocates a block of the heap, and returns its address"""
+        if size < 0:
+            raise VmError(f'Memory.alloc: invalid size {size}')
+
+        # Objects of classes without fields still need a unique address
+        size = max(size, 1)
+
+        for address, block_size in self._free.items():
+            if block_size >= size:
+                del self._free[address]
+                if block_size > size:
+                    self._free[address + size] = block_size - size
+
+                self._sizes[address] = size
+                return address
+
+        if self._next + size > HEAP_END:
+            raise VmError('Memory.alloc: heap overflow')
+
+        address = self._next
+        self._next += size
+        self._sizes[address] = size
+        return address
+
+    def dealloc(self, address: int) -> None:
+        """Frees a block that was allocated by alloc"""
+        size = self._sizes.pop(address, None)
+        if size is None:
+            raise VmError(f'Memory.deAlloc: {address} was not allocated')
+
+        self._free[address] = size
+
+    def string_value(self, string: int) -> str:
+        """Returns the text of a String object in the heap"""
+        ram = self._ram
+        return ''.join(map(chr, ram[string + 2:string + 2 + ram[string + 1]]))
+
+    def _poke(self, address: int, value: int) -> None:
+        self._ram[address] = value
+
+    def _divide(self, x: int, y: int) -> int:
+        if y == 0:
+            self._error(3)
+
+        quotient = abs(x) // abs(y)
+        return to_word(quotient if (x < 0) == (y < 0) else -quotient)
+
+    def _sqrt(self, x: int) -> int:
+        if x < 0:
+            self._error(4)
+
+        root = 0
+        while (root + 1) * (root + 1) <= x:
+            root += 1
+
+        return root
+
+    def _string_new(self, max_length: int) -> int:
+        # A string is its maximal length, its length and its characters
+        string = self.alloc(max_length + 2)
+        self._ram[string] = max_length
+        self._ram[string + 1] = 0
+        return string
+
+    def _string_from(self, text: str) -> int:
+        string = self._string_new(len(text))
+        for char in text:
+            self._string_append_char(string, ord(char))
+
+        return string
+
+    def _string_set_char_at(self, string: int, index: int, char: int) -> None:
+        self._ram[string + 2 + index] = char
+
+    def _string_append_char(self, string: int, char: int) -> int:
+        ram = self._ram
+        if ram[string + 1] >= ram[string]:
+            self._error(17)
+
+        ram[string + 2 + ram[string + 1]] = char
+        ram[string + 1] += 1
+        return string
+
+    def _string_erase_last_char(self, string: int) -> None:
+        if self._ram[string + 1] == 0:
+            self._error(18)
+
+        self._ram[string + 1] -= 1
+
+    def _string_int_value(self, string: int) -> int:
+        return self._parse_int(self.string_value(string))
+
+    def _string_set_int(self, string: int, value: int) -> None:
+        text = str(value)
+        if len(text) > self._ram[string]:
+            self._error(19)
+
+        self._ram[string + 1] = 0
+        for char in text:
+            self._string_append_char(string, ord(char))
+
+    @staticmethod
+    def _parse_int(text: str) -> int:
+        # Like String.intValue, reads the leading digits and ignores the rest
+        text = text.strip()
+        sign = -1 if text.startswith('-') else 1
+        digits = ''
+        for char in text[1:] if sign == -1 else text:
+            if not char.isdigit():
+                break
+
+            digits += char
+
+        return to_word(sign * int(digits or '0'))
+
+    def _type_line(self) -> None:
+        """Types the next input line, the keyboard reads its characters and then a new line"""
+        try:
+            self._typed = next(self._input) + '\n'
+        except StopIteration:
+            raise VmError('Keyboard: no more input')
+
+        # Typed characters are echoed, like the real keyboard does
+        self.output.append(self._typed)
+
+    def _read_line(self, message: int) -> str:
+        self.output.append(self.string_value(message))
+        if not self._typed:
+            self._type_line()
+
+        line, self._typed = self._typed[:-1], ''
+        return line
+
+    def _read_char(self) -> int:
+        if not self._typed:
+            self._type_line()
+
+        char, self._typed = self._typed[0], self._typed[1:]
+        return 128 if char == '\n' else ord(char)
+
+    def _halt(self) -> None:
+        raise Halt()
+
+    def _error(self, code: int) -> None:
+        raise VmError(f'Sys.error: {code}')
+
+
+class VmEmulator:
+    """
+    Runs a VM program headlessly, and counts the instructions it ran (labels aren't run) and their estimated
+    Hack CPU cycles.
+
+    The instructions are decoded once before running: labels and functions are resolved to addresses, static,
+    temp and pointer references to RAM addresses, and calls to OS classes to their Python stubs. Functions that
+    are defined in the program itself replace the stubs of the OS, so OS classes can be run as VM code too.
+    The program starts at Sys.init if it's defined, or at Main.main otherwise.
+    """
+    ram: List[int]
+    os: OperatingSystem
+    _code: List[Tuple[int, int, int]]
+    _stubs: List[Callable[..., Optional[int]]]
+    _functions: Dict[str, int]
+    _names: List[str]
+    _cycles_before: List[int]
+    _pc: int
+    halted: bool
+    instruction_count: int
+    cycle_count: int
+
+    def __init__(self, program: Program, input_lines: Iterable[str] = ()):
+        self.ram = [0] * RAM_SIZE
+        self.os = OperatingSystem(self.ram, input_lines)
+        self._stubs = []
+        self._names = []
+        self._code = self._decode(program)
+        self.halted = False
+        self.instruction_count = 0
+        self.cycle_count = 0
+
+        # The cycles of all the instructions before every address, so the cycles of a run of instructions are
+        # the difference between the addresses it starts and ends at
+        self._cycles_before = [0]
+        for operation, first, _ in self._code:
+            cycles = CYCLES[operation] + (first * CYCLES_PER_LOCAL if operation == FUNCTION else 0)
+            self._cycles_before.append(self._cycles_before[-1] + cycles)
+
+        entry = 'Sys.init' if 'Sys.init' in self._functions else 'Main.main'
+        if entry not in self._functions:
+            raise VmError(f'{entry} is not defined')
+
+        # The entry point is called with no arguments, and returns to a halt instruction
+        self.ram[SP] = STACK_BASE
+        self._call(len(self._code) - 1, 0)
+        self._pc = self._functions[entry]
+
+    def _decode(self, program: Program) -> List[Tuple[int, int, int]]:
+        # Labels are local to their functions and aren't run, a label is the address of the instruction after it.
+        # Statics are local to their classes, and every class gets as many as the highest index it uses.
+        self._functions = {}
+        labels = {}
+        statics_counts = {}
+        function_name = ''
+        address = 0
+        for class_name, instruction in program:
+            opcode = instruction[0]
+            if opcode == Opcode.LABEL:
+                labels[function_name, instruction[1]] = address
+                continue
+
+            if opcode == Opcode.FUNCTION:
+                function_name = instruction[1]
+                self._functions[function_name] = address
+            elif opcode in (Opcode.PUSH, Opcode.POP) and instruction[1] == Segment.STATIC:
+                statics_counts[class_name] = max(statics_counts.get(class_name, 0), instruction[2] + 1)
+
+            address += 1
+
+        static_bases = {}
+        next_static = STATIC_BASE
+        for class_name, count in statics_counts.items():
+            static_bases[class_name] = next_static
+            next_static += count
+
+        os_subroutines = self.os.subroutines()
+        code = []
+        for class_name, instruction in program:
+            opcode = instruction[0]
+            if opcode in (Opcode.PUSH, Opcode.POP):
+                segment, index = instruction[1], instruction[2]
+                if segment == Segment.CONSTANT:
+                    code.append((PUSH_CONSTANT, index, 0))
+                elif segment in _SEGMENT_REGISTERS:
+                    code.append((PUSH_SEGMENT if opcode == Opcode.PUSH else POP_SEGMENT,
+                                 _SEGMENT_REGISTERS[segment], index))
+                else:
+                    if segment == Segment.STATIC:
+                        address = static_bases[class_name] + index
+                    elif segment == Segment.TEMP:
+                        address = TEMP_BASE + index
+                    else:
+                        address = THIS + index
+
+                    code.append((PUSH_ADDRESS if opcode == Opcode.PUSH else POP_ADDRESS, address, 0))
+
+            elif opcode in _ARITHMETIC_OPERATIONS:
+                code.append((_ARITHMETIC_OPERATIONS[opcode], 0, 0))
+
+            elif opcode == Opcode.FUNCTION:
+                function_name = instruction[1]
+                code.append((FUNCTION, instruction[2], 0))
+
+            elif opcode in (Opcode.GOTO, Opcode.IF_GOTO):
+                target = labels.get((function_name, instruction[1]))
+                if target is None:
+                    raise VmError(f'{function_name}: label {instruction[1]} is not defined')
+
+                code.append((GOTO if opcode == Opcode.GOTO else IF_GOTO, target, 0))
+
+            elif opcode == Opcode.CALL:
+                name, arguments_count = instruction[1], instruction[2]
+                if name in self._functions:
+                    code.append((CALL, self._functions[name], arguments_count))
+                elif name in os_subroutines:
+                    stub, stub_arguments_count = os_subroutines[name]
+                    if stub_arguments_count != arguments_count:
+                        raise VmError(f'{name} takes {stub_arguments_count} arguments, not {arguments_count}')
+
+                    self._stubs.append(stub)
+                    code.append((CALL_OS, len(self._stubs) - 1, arguments_count))
+                else:
+                    # Only an error if the call is actually made
+                    self._names.append(name)
+                    code.append((CALL_UNDEFINED, len(self._names) - 1, arguments_count))
+
+            elif opcode == Opcode.RETURN:
+                code.append((RETURN, 0, 0))
+
+        code.append((HALT, 0, 0))
+        return code
+
+    def _call(self, target: int, arguments_count: int) -> None:
+        """Calls the function at a given address from outside of the program, with the arguments on the stack"""
+        ram = self.ram
+        sp = ram[SP]
+        ram[sp:sp + 5] = [len(self._code) - 1, ram[LCL], ram[ARG], ram[THIS], ram[THAT]]
+        ram[ARG] = sp - arguments_count
+        ram[LCL] = ram[SP] = sp + 5
+
+    def run(self, max_instructions: Optional[int] = None) -> bool:
+        """
+        Runs the program until it halts, or until it runs the given amount of instructions (it stops at the first
+        jump, call or return after that). Returns whether the program halted. Can be called again to continue
+        running a program that didn't halt.
+        """
+        code = self._code
+        cycles_before = self._cycles_before
+        ram = self.ram
+        stubs = self._stubs
+        pc = self._pc
+        sp = ram[SP]
+        limit = float('inf') if max_instructions is None else self.instruction_count + max_instructions
+
+        # Instructions aren't counted one by one: they run in straight runs between jumps, so whenever the program
+        # jumps the whole run from start to pc is counted at once
+        start = pc
+        count = self.instruction_count
+        cycles = self.cycle_count
+
+        try:
+            while True:
+                operation, first, second = code[pc]
+                pc += 1
+
+                if operation == PUSH_CONSTANT:
+                    ram[sp] = first
+                    sp += 1
+                elif operation == PUSH_SEGMENT:
+                    ram[sp] = ram[ram[first] + second]
+                    sp += 1
+                elif operation == PUSH_ADDRESS:
+                    ram[sp] = ram[first]
+                    sp += 1
+                elif operation == POP_SEGMENT:
+                    sp -= 1
+                    ram[ram[first] + second] = ram[sp]
+                elif operation == POP_ADDRESS:
+                    sp -= 1
+                    ram[first] = ram[sp]
+                elif operation == ADD:
+                    sp -= 1
+                    value = ram[sp - 1] + ram[sp]
+                    ram[sp - 1] = value if -32768 <= value <= 32767 else to_word(value)
+                elif operation == SUB:
+                    sp -= 1
+                    value = ram[sp - 1] - ram[sp]
+                    ram[sp - 1] = value if -32768 <= value <= 32767 else to_word(value)
+                elif operation == IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        count += pc - start
+                        cycles += cycles_before[pc] - cycles_before[start]
+                        pc = start = first
+                        if count >= limit:
+                            break
+                elif operation == GOTO:
+                    count += pc - start
+                    cycles += cycles_before[pc] - cycles_before[start]
+                    pc = start = first
+                    if count >= limit:
+                        break
+                elif operation == LT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+                elif operation == GT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+                elif operation == EQ:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+                elif operation == NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                elif operation == NEG:
+                    ram[sp - 1] = to_word(-ram[sp - 1])
+                elif operation == AND:
+                    sp -= 1
+                    ram[sp - 1] &= ram[sp]
+                elif operation == OR:
+                    sp -= 1
+                    ram[sp - 1] |= ram[sp]
+                elif operation == CALL:
+                    ram[sp] = pc
+                    ram[sp + 1] = ram[LCL]
+                    ram[sp + 2] = ram[ARG]
+                    ram[sp + 3] = ram[THIS]
+                    ram[sp + 4] = ram[THAT]
+                    ram[ARG] = sp - second
+                    sp += 5
+                    ram[LCL] = sp
+                    count += pc - start
+                    cycles += cycles_before[pc] - cycles_before[start]
+                    pc = start = first
+                    if count >= limit:
+                        break
+                elif operation == FUNCTION:
+                    ram[sp:sp + first] = [0] * first
+                    sp += first
+                elif operation == RETURN:
+                    frame = ram[LCL]
+                    return_address = ram[frame - 5]
+                    argument = ram[ARG]
+                    ram[argument] = ram[sp - 1]
+                    sp = argument + 1
+                    ram[THAT] = ram[frame - 1]
+                    ram[THIS] = ram[frame - 2]
+                    ram[ARG] = ram[frame - 3]
+                    ram[LCL] = ram[frame - 4]
+                    count += pc - start
+                    cycles += cycles_before[pc] - cycles_before[start]
+                    pc = start = return_address
+                    if count >= limit:
+                        break
+                elif operation == CALL_OS:
+                    sp -= second
+                    ram[SP] = sp
+                    result = stubs[first](*ram[sp:sp + second])
+                    ram[sp] = result or 0
+                    sp += 1
+                elif operation == CALL_UNDEFINED:
+                    raise VmError(f'{self._names[first]} is not defined')
+                else:
+                    # The entry point returned
+                    pc -= 1
+                    self.halted = True
+                    break
+
+        except Halt:
+            self.halted = True
+
+        finally:
+            self._pc = pc
+            ram[SP] = sp
+            self.instruction_count = count + pc - start
+            self.cycle_count = cycles + cycles_before[pc] - cycles_before[start]
+
+        return self.halted
+
+    @property
+    def output(self) -> str:
+        """The text the program printed"""
+        return ''.join(self.os.output)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Main entrypoint of the module, argv are the command line arguments (sys.argv by default)"""
+    parser = argparse.ArgumentParser(description="Jack VM emulator, runs compiled VM code headlessly.")
+    parser.add_argument('--input', help="A file with the lines the program reads from the keyboard.")
+    parser.add_argument('--max-instructions', type=int, default=100_000_000,
+                        help="Stop the program after running this many instructions (0 for no limit).")
+    parser.add_argument('path', help="A path to a VM file, or a directory with VM files.")
+    args = parser.parse_args(argv)
+
+    input_lines = []
+    if args.input is not None:
+        with open(args.input, 'r') as input_obj:
+            input_lines = input_obj.read().splitlines()
+
+    try:
+        emulator = VmEmulator(load_program(args.path), input_lines)
+        halted = emulator.run(args.max_instructions or None)
+    except (VmError, ValueError, OSError) as err:
+        print(f'Error: {str(err)}', file=sys.stderr)
+        return 1
+
+    print(emulator.output)
+    if not halted:
+        print(f'Stopped after {args.max_instructions} instructions')
+
+    print(f'{emulator.instruction_count} VM instructions, {emulator.cycle_count} cycles')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
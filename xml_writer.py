@@ -1,71 +1,105 @@
 from lexer import Token
-from typing import TextIO
+from typing import Dict, List, TextIO, Tuple
 
 
 def _encapsulate(string: str) -> str:
-    return string \
-            .replace('&', '&amp;') \
-            .replace('<', '&lt;') \
-            .replace('>', '&gt;') \
-            .replace('"', '&quot;')
+    # Almost no value has special characters, and checking for them is much faster than replacing them
+    if '&' not in string and '<' not in string and '>' not in string and '"' not in string:
+        return string
+
+    return (string.replace('&', '&amp;')
+                  .replace('<', '&lt;')
+                  .replace('>', '&gt;')
+                  .replace('"', '&quot;'))
 
 
 class XmlWriter:
+    """
+    Writes an XML hierarchy of elements and tokens to a file.
+    The lines are accumulated in a buffer, that is written to the file in large chunks: whenever it grows
+    beyond buffer_size lines, and when the top level element is closed. Lines that were written outside of
+    any element are only written to the file by flush.
+    """
     _file_obj: TextIO
-    _hierarchy_stack: list
+    _hierarchy_stack: List[str]
     _indentation: str
-
-    def __init__(self, file_obj, indentation='  '):
+    _buffer: List[str]
+    _buffer_size: int
+    _indents: List[str]
+    _current_indent: str
+    _element_tags: Dict[str, Tuple[str, str]]
+    _token_tags: Dict[str, Tuple[str, str]]
+
+    def __init__(self, file_obj, indentation='  ', buffer_size: int = 4096):
         self._file_obj = file_obj
         self._hierarchy_stack = []
         self._indentation = indentation
-
-    def _write_new_line(self) -> None:
-        """Writes a new line to the file."""
-        self._file_obj.write('\n')
-
-    def _write_indentation(self) -> None:
-        """Writes indentation to the file based on the opened tags hierarchy."""
-        count = len(self._hierarchy_stack)
-        self._file_obj.write(self._indentation * count)
-
-    def _write_tag(self, content: str, closing=False) -> None:
-        """Outputs the given tag."""
-        if closing:
-            self._file_obj.write(f'</{_encapsulate(content)}>')
-        else:
-            self._file_obj.write(f'<{_encapsulate(content)}>')
+        self._buffer = []
+        self._buffer_size = buffer_size
+
+        # The indentation of every depth, and the rendered tags of every element and token type, are only
+        # created once
+        self._indents = ['']
+        self._current_indent = ''
+        self._element_tags = {}
+        self._token_tags = {}
+
+    def _indent(self, depth: int) -> str:
+        """Returns the indentation of lines in the given depth of the hierarchy."""
+        while len(self._indents) <= depth:
+            self._indents.append(self._indentation * len(self._indents))
+
+        return self._indents[depth]
+
+    def _render_element_tags(self, element_type: str) -> Tuple[str, str]:
+        """Renders the lines of the open and close tags of an element type, without their indentation."""
+        tag = _encapsulate(element_type)
+        tags = self._element_tags[element_type] = (f'<{tag}>\n', f'</{tag}>\n')
+        return tags
+
+    def _render_token_tags(self, token_type: str) -> Tuple[str, str]:
+        """Renders the open and close tags of a token type, with the spaces around the value."""
+        tag = _encapsulate(token_type)
+        tags = self._token_tags[token_type] = (f'<{tag}> ', f' </{tag}>\n')
+        return tags
+
+    def flush(self) -> None:
+        """Writes the buffered lines to the file."""
+        if self._buffer:
+            self._file_obj.write(''.join(self._buffer))
+            self._buffer.clear()
 
     def _start_element(self, element_type: str) -> None:
         """
         Starts a new tag with the given hierarchy that will be closed after calling
         self._close_element
         """
-        self._write_indentation()
-        self._write_tag(element_type)
-        self._write_new_line()
+        open_tag = (self._element_tags.get(element_type) or self._render_element_tags(element_type))[0]
+        self._buffer.append(self._current_indent + open_tag)
         self._hierarchy_stack.append(element_type)
+        self._current_indent = self._indent(len(self._hierarchy_stack))
 
     def _close_element(self) -> None:
         """
         Closes the last opened element.
         """
         element_type = self._hierarchy_stack.pop()
-        self._write_indentation()
-        self._write_tag(f'{element_type}', closing=True)
-        self._write_new_line()
+        self._current_indent = self._indent(len(self._hierarchy_stack))
+        self._buffer.append(self._current_indent + self._element_tags[element_type][1])
+        if not self._hierarchy_stack or len(self._buffer) >= self._buffer_size:
+            self.flush()
 
     def element(self, element_type: str) -> '_XmlElementContext':
         """
         Returns a context manager that can be used in with statements.
         For example:
             with writer.element('hello'):
-                writer.write_token(Token('value', 'type'))
+                writer.write_token_value('type', 'value')
 
         Will produce:
             <hello>
                 <type> value </type>
-            </hello
+            </hello>
         """
         return _XmlElementContext(self, element_type)
 
@@ -74,11 +108,19 @@ class XmlWriter:
         Writes a line represents a given token in to following format:
             <token_type> token_value </token_type>
         """
-        self._write_indentation()
-        self._write_tag(token.type)
-        self._file_obj.write(f' {_encapsulate(token.value)} ')
-        self._write_tag(token.type, closing=True)
-        self._write_new_line()
+        self.write_token_value(token.type, token.value)
+
+    def write_token_value(self, token_type: str, value: str) -> None:
+        """
+        Writes a line represents a token with the given type and value, without a Token object.
+        """
+        open_tag, close_tag = self._token_tags.get(token_type) or self._render_token_tags(token_type)
+        self._buffer.append(f'{self._current_indent}{open_tag}{_encapsulate(value)}{close_tag}')
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    # The interface of SyntaxBuilder, so a parser can write the syntax it parses right away instead of keeping it
+    add_token = write_token_value
 
 
 class _XmlElementContext: